@@ -2,7 +2,8 @@ import os
 
 import httpx
 from fastapi import FastAPI, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Optional, Dict, List
 from pydantic import BaseModel
@@ -25,17 +26,46 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-<<<<<<< HEAD
-ORDERS_SERVICE_URL = os.getenv("ORDERS_SERVICE_URL", "http://orders_service:8000")
-PAYMENTS_SERVICE_URL = os.getenv("PAYMENTS_SERVICE_URL", "http://payments_service:8000")
-=======
 ORDERS_URL = os.getenv("ORDERS_URL", "http://orders:8002")
 PAYMENTS_URL = os.getenv("PAYMENTS_URL", "http://payments:8001")
 WALLET_SERVICE_URL = "http://wallet_service:8000"
 PURCHASE_SERVICE_URL = "http://purchase_service:8000"
->>>>>>> 8920008b2aafe9ef0737f46560bc2ee9d67f7662
 
-client = httpx.AsyncClient(timeout=10.0)
+# Connection limits apply per downstream service, so a slow service cannot take the
+# connections of the other one.
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+# Longest wait for a free connection when HTTP_MAX_CONNECTIONS are busy.
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "5"))
+# Read/write timeouts per kind of route.
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+HTTP_LIST_TIMEOUT = float(os.getenv("HTTP_LIST_TIMEOUT", "30"))
+HTTP_PROXY_TIMEOUT = float(os.getenv("HTTP_PROXY_TIMEOUT", "60"))
+
+def http_timeout(seconds: float) -> httpx.Timeout:
+    return httpx.Timeout(seconds, connect=HTTP_CONNECT_TIMEOUT, pool=HTTP_POOL_TIMEOUT)
+
+def make_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=http_timeout(HTTP_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+# One client per downstream service, shared for the app's lifetime so requests reuse
+# keep-alive connections; closed at shutdown.
+orders_client = make_client()
+payments_client = make_client()
+
+@app.on_event("shutdown")
+async def close_clients():
+    await orders_client.aclose()
+    await payments_client.aclose()
 
 class ConnectionManager:
     def __init__(self):
@@ -71,39 +101,72 @@ class PurchaseCreate(BaseModel):
     amount: float
     product_description: Optional[str] = None
 
-async def proxy_request(request: Request, target_url: str) -> Response:
+# RFC 9110 section 7.6.1: meaningful for one connection only, never forwarded.
+HOP_BY_HOP_HEADERS = frozenset({
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "proxy-connection",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+})
+
+def end_to_end_headers(headers: list, drop: frozenset = frozenset()) -> list:
+    """Filter (name, value) pairs down to end-to-end headers.
+
+    Besides the fixed hop-by-hop set, drops every header listed in Connection and
+    the names in drop. Repeated headers such as Set-Cookie are kept as they are.
+    """
+    listed = {
+        token.strip().lower()
+        for name, value in headers if name.lower() == "connection"
+        for token in value.split(",")
+    }
+    return [
+        (name, value) for name, value in headers
+        if name.lower() not in HOP_BY_HOP_HEADERS and name.lower() not in listed and name.lower() not in drop
+    ]
+
+async def proxy_request(request: Request, client: httpx.AsyncClient, target_url: str) -> Response:
+    """Stream a request to target_url and the reply back, chunk by chunk.
+
+    Neither body is held in memory as a whole. If the client goes away mid-response,
+    the upstream response is closed, which drops the upstream connection.
+    """
     url = target_url + request.url.path
     if request.url.query:
         url += f"?{request.url.query}"
+    headers = end_to_end_headers(
+        [(name.decode("latin-1"), value.decode("latin-1")) for name, value in request.headers.raw],
+        drop=frozenset({"host"}),
+    )
+    has_body = "content-length" in request.headers or "transfer-encoding" in request.headers
+    upstream_request = client.build_request(
+        method=request.method,
+        url=url,
+        headers=headers,
+        content=request.stream() if has_body else None,
+        timeout=http_timeout(HTTP_PROXY_TIMEOUT),
+    )
     try:
-        body_bytes = await request.body()
-    except Exception:
-        body_bytes = b""
-    headers = {
-        name.decode(): value.decode()
-        for name, value in request.headers.raw
-        if name.decode().lower() != "host"
-    }
-    try:
-        resp = await client.request(
-            method=request.method,
-            url=url,
-            headers=headers,
-            content=body_bytes,
-        )
+        resp = await client.send(upstream_request, stream=True)
     except httpx.RequestError as e:
         raise HTTPException(status_code=502, detail=f"Bad gateway: {e}")
-    return Response(
-        content=resp.content,
-        status_code=resp.status_code,
-        headers=dict(resp.headers),
-        media_type=resp.headers.get("content-type"),
+    # aiter_raw passes the body through undecoded, so Content-Encoding and
+    # Content-Length stay valid.
+    response = StreamingResponse(
+        resp.aiter_raw(), status_code=resp.status_code, background=BackgroundTask(resp.aclose)
     )
+    response.raw_headers = [
+        (name.encode("latin-1"), value.encode("latin-1"))
+        for name, value in end_to_end_headers(resp.headers.multi_items())
+    ]
+    return response
 
-<<<<<<< HEAD
-=======
 
->>>>>>> 8920008b2aafe9ef0737f46560bc2ee9d67f7662
 @app.post("/orders")
 @app.get("/orders")
 @app.get("/orders/{rest_of_path:path}")
@@ -114,12 +177,7 @@ async def proxy_orders(request: Request):
     GET  /orders/{order_id}
     Любые запросы, начинающиеся с /orders, проксируем в Orders Service.
     """
-<<<<<<< HEAD
-    return await proxy_request(request, ORDERS_SERVICE_URL)
-
-@app.post("/api/wallet/create", tags=["Wallets"])
-=======
-    return await proxy_request(request, ORDERS_URL)
+    return await proxy_request(request, orders_client, ORDERS_URL)
 
 
 @app.post("/accounts")
@@ -132,7 +190,7 @@ async def proxy_payments(request: Request):
     GET  /accounts/{user_id}          -> Payments
     Всё, что начинается с /accounts, по умолчанию идёт в Payments Service.
     """
-    return await proxy_request(request, PAYMENTS_URL)
+    return await proxy_request(request, payments_client, PAYMENTS_URL)
 
 
 @app.websocket("/ws/{purchase_id}")
@@ -146,123 +204,75 @@ async def websocket_endpoint(websocket: WebSocket, purchase_id: int):
         manager.disconnect(websocket, purchase_id)
 
 @app.post("/wallets", tags=["Wallets"])
->>>>>>> 8920008b2aafe9ef0737f46560bc2ee9d67f7662
 async def create_wallet(wallet: WalletCreate):
     """
     Create a new wallet for a user.
     """
-    async with client as c:
-<<<<<<< HEAD
-        response = await c.post(f"{PAYMENTS_SERVICE_URL}/wallets", json=wallet.dict())
-        return response.json()
-
-@app.get("/api/wallet/{user_id}", tags=["Wallets"])
-=======
-        response = await c.post(f"{WALLET_SERVICE_URL}/wallets", json=wallet.dict())
-        return response.json()
+    response = await payments_client.post(f"{WALLET_SERVICE_URL}/wallets", json=wallet.dict())
+    return response.json()
 
 @app.get("/wallets/{user_id}", tags=["Wallets"])
->>>>>>> 8920008b2aafe9ef0737f46560bc2ee9d67f7662
 async def get_wallet(user_id: int):
     """
     Get wallet information for a specific user.
     """
-    async with client as c:
-<<<<<<< HEAD
-        response = await c.get(f"{PAYMENTS_SERVICE_URL}/wallets/{user_id}")
-=======
-        response = await c.get(f"{WALLET_SERVICE_URL}/wallets/{user_id}")
->>>>>>> 8920008b2aafe9ef0737f46560bc2ee9d67f7662
-        if response.status_code == 404:
-            raise HTTPException(status_code=404, detail="Wallet not found")
-        return response.json()
-
-<<<<<<< HEAD
-@app.post("/api/wallet/deposit", tags=["Wallets"])
-=======
+    response = await payments_client.get(f"{WALLET_SERVICE_URL}/wallets/{user_id}")
+    if response.status_code == 404:
+        raise HTTPException(status_code=404, detail="Wallet not found")
+    return response.json()
+
 @app.post("/wallets/{user_id}/deposit", tags=["Wallets"])
->>>>>>> 8920008b2aafe9ef0737f46560bc2ee9d67f7662
 async def deposit_money(user_id: int, deposit: WalletDeposit):
     """
     Deposit money into a user's wallet.
     """
-    async with client as c:
-<<<<<<< HEAD
-        response = await c.post(f"{PAYMENTS_SERVICE_URL}/wallets/{user_id}/deposit", json=deposit.dict())
-=======
-        response = await c.post(f"{WALLET_SERVICE_URL}/wallets/{user_id}/deposit", json=deposit.dict())
->>>>>>> 8920008b2aafe9ef0737f46560bc2ee9d67f7662
-        if response.status_code == 404:
-            raise HTTPException(status_code=404, detail="Wallet not found")
-        return response.json()
+    response = await payments_client.post(f"{WALLET_SERVICE_URL}/wallets/{user_id}/deposit", json=deposit.dict())
+    if response.status_code == 404:
+        raise HTTPException(status_code=404, detail="Wallet not found")
+    return response.json()
 
 @app.post("/purchases", tags=["Purchases"])
 async def create_purchase(purchase: PurchaseCreate):
     """
     Create a new purchase order.
     """
-    async with client as c:
-<<<<<<< HEAD
-        response = await c.post(f"{PAYMENTS_SERVICE_URL}/purchases", json=purchase.dict())
-=======
-        response = await c.post(f"{PURCHASE_SERVICE_URL}/purchases", json=purchase.dict())
->>>>>>> 8920008b2aafe9ef0737f46560bc2ee9d67f7662
-        data = response.json()
-        # Notify WebSocket clients about the new purchase
-        await manager.broadcast_update(data["id"], json.dumps({
-            "type": "purchase_update",
-            "purchase_id": data["id"],
-            "status": data["status"]
-        }))
-        return data
+    response = await orders_client.post(f"{PURCHASE_SERVICE_URL}/purchases", json=purchase.dict())
+    data = response.json()
+    # Notify WebSocket clients about the new purchase
+    await manager.broadcast_update(data["id"], json.dumps({
+        "type": "purchase_update",
+        "purchase_id": data["id"],
+        "status": data["status"]
+    }))
+    return data
 
 @app.get("/purchases/{purchase_id}", tags=["Purchases"])
 async def get_purchase(purchase_id: int):
     """
     Get information about a specific purchase.
     """
-    async with client as c:
-<<<<<<< HEAD
-        response = await c.get(f"{PAYMENTS_SERVICE_URL}/purchases/{purchase_id}")
-=======
-        response = await c.get(f"{PURCHASE_SERVICE_URL}/purchases/{purchase_id}")
->>>>>>> 8920008b2aafe9ef0737f46560bc2ee9d67f7662
-        if response.status_code == 404:
-            raise HTTPException(status_code=404, detail="Purchase not found")
-        data = response.json()
-        # Notify WebSocket clients about any status changes
-        await manager.broadcast_update(purchase_id, json.dumps({
-            "type": "purchase_update",
-            "purchase_id": purchase_id,
-            "status": data["status"]
-        }))
-        return data
+    response = await orders_client.get(f"{PURCHASE_SERVICE_URL}/purchases/{purchase_id}")
+    if response.status_code == 404:
+        raise HTTPException(status_code=404, detail="Purchase not found")
+    data = response.json()
+    # Notify WebSocket clients about any status changes
+    await manager.broadcast_update(purchase_id, json.dumps({
+        "type": "purchase_update",
+        "purchase_id": purchase_id,
+        "status": data["status"]
+    }))
+    return data
 
 @app.get("/purchases", tags=["Purchases"])
 async def list_purchases():
     """
     List all purchases.
     """
-    async with client as c:
-<<<<<<< HEAD
-        response = await c.get(f"{PAYMENTS_SERVICE_URL}/purchases")
-        return response.json()
-
-@app.websocket("/ws/{purchase_id}")
-async def websocket_endpoint(websocket: WebSocket, purchase_id: int):
-    await manager.connect(websocket, purchase_id)
-    try:
-        while True:
-            data = await websocket.receive_text()
-            # Handle any incoming messages if needed
-    except WebSocketDisconnect:
-        manager.disconnect(websocket, purchase_id)
-
-=======
-        response = await c.get(f"{PURCHASE_SERVICE_URL}/purchases")
-        return response.json()
+    response = await orders_client.get(
+        f"{PURCHASE_SERVICE_URL}/purchases", timeout=http_timeout(HTTP_LIST_TIMEOUT)
+    )
+    return response.json()
 
->>>>>>> 8920008b2aafe9ef0737f46560bc2ee9d67f7662
 @app.middleware("http")
 async def catch_not_found(request: Request, call_next):
     try:
@@ -3,50 +3,56 @@ import json
 from fastapi.testclient import TestClient
 import httpx
 
-from main import app, client as async_client
+from main import app, orders_client, payments_client
 
 client = TestClient(app)
 
-class DummyResponse:
-    def __init__(self, status_code: int, json_data, headers=None):
-        self.status_code = status_code
-        self._json = json_data
-        self.content = json.dumps(json_data).encode()
-        self.headers = headers or {"content-type": "application/json"}
+async def dummy_response(status_code: int, json_data, headers=None, stream=False):
+    """A response whose body is still unread, like the one client.send returns.
 
-    def json(self):
-        return self._json
+    With stream=False it is read here, as client.send does itself.
+    """
+    body = json.dumps(json_data).encode()
+    headers = {"Content-Type": "application/json", "Content-Length": str(len(body)), **(headers or {})}
+    response = httpx.Response(status_code, headers=headers, stream=httpx.ByteStream(body))
+    if not stream:
+        await response.aread()
+    return response
 
 @pytest.fixture(autouse=True)
 def mock_httpx_request(monkeypatch):
-    async def fake_request(method, url, headers=None, content=None, timeout=None):
+    async def fake_send(request, stream=False, **kwargs):
+        method = request.method
+        url = str(request.url)
+        content = await request.aread()
         if url.startswith("http://purchase"):
             if method == "GET":
                 if url.rstrip("/").endswith("/purchases"):
-                    return DummyResponse(200, {"purchases": [{"id": 1, "user_id": 1, "amount": 10,
+                    return await dummy_response(200, {"purchases": [{"id": 1, "user_id": 1, "amount": 10,
                                                 "product_description": None, "status":"PENDING",
-                                                "created_at":"2025-06-07T00:00:00"}]})
+                                                "created_at":"2025-06-07T00:00:00"}]}, stream=stream)
                 else:
-                    return DummyResponse(200, {"id": 1, "user_id": 1, "amount": 10,
+                    return await dummy_response(200, {"id": 1, "user_id": 1, "amount": 10,
                                                "product_description": None, "status":"PENDING",
-                                               "created_at":"2025-06-07T00:00:00"})
+                                               "created_at":"2025-06-07T00:00:00"}, stream=stream)
             if method == "POST":
                 data = json.loads(content or b"{}")
-                return DummyResponse(200, {"id": 2, **data, "status":"PENDING",
-                                           "created_at":"2025-06-07T00:00:00"})
+                return await dummy_response(200, {"id": 2, **data, "status":"PENDING",
+                                           "created_at":"2025-06-07T00:00:00"}, stream=stream)
         if url.startswith("http://wallet"):
             if method == "POST":
                 data = json.loads(content or b"{}")
                 if url.rstrip("/").endswith("/wallets"):
-                    return DummyResponse(200, {"user_id": data["user_id"], "money": 0})
+                    return await dummy_response(200, {"user_id": data["user_id"], "money": 0}, stream=stream)
                 else:
-                    return DummyResponse(200, {"user_id": 1, "money": data["amount"]})
+                    return await dummy_response(200, {"user_id": 1, "money": data["amount"]}, stream=stream)
             if method == "GET":
-                return DummyResponse(200, {"user_id": 1, "money": 100})
+                return await dummy_response(200, {"user_id": 1, "money": 100}, stream=stream)
 
-        return DummyResponse(404, {"detail":"Not Found"})
+        return await dummy_response(404, {"detail":"Not Found"}, stream=stream)
 
-    monkeypatch.setattr(async_client, "request", fake_request)
+    monkeypatch.setattr(orders_client, "send", fake_send)
+    monkeypatch.setattr(payments_client, "send", fake_send)
 
 
 def test_proxy_list_purchases():
@@ -75,3 +81,45 @@ def test_proxy_create_and_deposit_wallet():
     assert r2.status_code == 200 and r2.json()["money"] == 50
     r3 = client.get("/wallets/9")
     assert r3.status_code == 200 and r3.json()["money"] == 100
+
+def test_proxy_drops_hop_by_hop_headers(monkeypatch):
+    seen = {}
+
+    async def fake_send(request, stream=False, **kwargs):
+        seen.update(request.headers)
+        return await dummy_response(200, {"purchases": []}, headers={
+            "Connection": "X-Internal", "X-Internal": "1", "Keep-Alive": "timeout=5", "X-Request-Id": "abc"
+        }, stream=stream)
+
+    monkeypatch.setattr(orders_client, "send", fake_send)
+    monkeypatch.setattr(payments_client, "send", fake_send)
+    r = client.get("/orders", headers={"Connection": "X-Drop", "X-Drop": "1", "TE": "trailers", "X-Trace": "t"})
+    assert r.status_code == 200 and r.json() == {"purchases": []}
+    assert "x-drop" not in seen and "te" not in seen and seen["x-trace"] == "t"
+    assert "x-internal" not in r.headers and "keep-alive" not in r.headers
+    assert r.headers["x-request-id"] == "abc"
+
+
+def test_routes_use_their_service_client_and_timeout(monkeypatch):
+    import main
+
+    seen = []
+
+    def recording_send(service):
+        async def fake_send(request, stream=False, **kwargs):
+            seen.append((service, request.url.path, request.extensions["timeout"]["read"]))
+            return await dummy_response(200, {"purchases": [], "user_id": 1, "money": 0}, stream=stream)
+        return fake_send
+
+    monkeypatch.setattr(orders_client, "send", recording_send("orders"))
+    monkeypatch.setattr(payments_client, "send", recording_send("payments"))
+    client.get("/wallets/1")
+    client.get("/purchases")
+    client.get("/orders")
+    client.get("/accounts/1")
+    assert seen == [
+        ("payments", "/wallets/1", main.HTTP_TIMEOUT),
+        ("orders", "/purchases", main.HTTP_LIST_TIMEOUT),
+        ("orders", "/orders", main.HTTP_PROXY_TIMEOUT),
+        ("payments", "/accounts/1", main.HTTP_PROXY_TIMEOUT),
+    ]
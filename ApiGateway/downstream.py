@@ -0,0 +1,99 @@
+import httpx
+
+
+class Downstream:
+    """App-lifetime keep-alive HTTP client for one downstream service.
+
+    Opened in the startup hook and closed at shutdown, so requests reuse pooled
+    connections instead of paying a new TCP connection each time. timeout is the
+    read/write timeout; routes can pass their own per request.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        timeout: float = 10.0,
+        connect_timeout: float = 5.0,
+        pool_timeout: float = 5.0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0
+    ):
+        self.name = name
+        self.base_url = base_url
+        self.connect_timeout = connect_timeout
+        self.pool_timeout = pool_timeout
+        self.timeout = self.make_timeout(timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.client = None
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.pool_timeouts = 0
+        self.connections_opened = 0
+
+    def make_timeout(self, timeout: float) -> httpx.Timeout:
+        return httpx.Timeout(timeout, connect=self.connect_timeout, pool=self.pool_timeout)
+
+    async def start(self):
+        self.client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self.limits)
+
+    async def stop(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def request(self, method: str, path: str, timeout: float = None, **kwargs) -> httpx.Response:
+        if self.client is None:
+            raise RuntimeError(f"{self.name} client is not started")
+        if timeout is not None:
+            kwargs["timeout"] = self.make_timeout(timeout)
+        self.requests += 1
+        self.in_flight += 1
+        try:
+            return await self.client.request(method, path, extensions={"trace": self._trace}, **kwargs)
+        except httpx.PoolTimeout:
+            self.errors += 1
+            self.pool_timeouts += 1
+            raise
+        except httpx.RequestError:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def _trace(self, event: str, info: dict):
+        # httpcore reports connection events through the documented "trace" request extension.
+        if event == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", path, **kwargs)
+
+    def stats(self) -> dict:
+        """Counters kept by this client plus its configuration.
+
+        httpx has no public view of its connection pool. in_flight above
+        max_connections, or a growing pool_timeouts, means requests wait for a
+        connection; connections_opened growing with requests means keep-alive
+        connections are not being reused.
+        """
+        return {
+            "base_url": self.base_url,
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "pool_timeouts": self.pool_timeouts,
+            "connections_opened": self.connections_opened,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "keepalive_expiry": self.limits.keepalive_expiry,
+        }
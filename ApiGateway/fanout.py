@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from enum import Enum
+from typing import Dict, Optional, Set
+
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT = '{"type": "ping"}'
+# 1013 Try Again Later: the client could not keep up with its updates.
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+class SlowConsumerPolicy(str, Enum):
+    DROP_OLDEST = "drop_oldest"
+    DISCONNECT = "disconnect"
+
+
+class Subscriber:
+    """One WebSocket: its purchase_ids and the messages waiting for its sender task.
+
+    A deque and one waiter future instead of an asyncio.Queue: this is per connection,
+    and at tens of thousands of idle sockets the Queue's own deques and Event add up.
+    """
+
+    __slots__ = ("websocket", "purchase_ids", "pending", "waiter", "task", "last_sent", "dropped")
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.purchase_ids: Set[int] = set()
+        self.pending = deque()
+        self.waiter: Optional[asyncio.Future] = None
+        self.task: Optional[asyncio.Task] = None
+        self.last_sent = time.monotonic()
+        self.dropped = 0
+
+    def push(self, message: str):
+        self.pending.append(message)
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    async def next_message(self) -> str:
+        while not self.pending:
+            self.waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self.waiter
+            finally:
+                self.waiter = None
+        return self.pending.popleft()
+
+
+class ConnectionManager:
+    """Fans purchase updates out to WebSockets without letting one client hold up another.
+
+    Every socket has a bounded send queue and a sender task that is the only writer to
+    that socket. broadcast_update only enqueues, so it never waits on a client. When a
+    queue is full, the slow client either loses its oldest pending message or is
+    disconnected, depending on policy. Sockets that sent nothing for heartbeat_interval
+    seconds get a ping, which keeps proxies from closing them and finds dead peers.
+    """
+
+    def __init__(
+        self,
+        queue_size: int = 64,
+        policy: SlowConsumerPolicy = SlowConsumerPolicy.DROP_OLDEST,
+        heartbeat_interval: float = 30.0,
+        max_subscriptions: int = 100
+    ):
+        self.queue_size = queue_size
+        self.policy = SlowConsumerPolicy(policy)
+        self.heartbeat_interval = heartbeat_interval
+        self.max_subscriptions = max_subscriptions
+        self.connections: Dict[WebSocket, Subscriber] = {}
+        self.by_purchase: Dict[int, Set[Subscriber]] = {}
+        self.sent = 0
+        self.dropped = 0
+        self.slow_disconnects = 0
+        self._heartbeat_task = None
+
+    def start(self):
+        if self.heartbeat_interval:
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    async def stop(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        for websocket in list(self.connections):
+            self.disconnect(websocket)
+
+    async def connect(self, websocket: WebSocket) -> Subscriber:
+        await websocket.accept()
+        subscriber = Subscriber(websocket)
+        subscriber.task = asyncio.create_task(self._send(subscriber))
+        self.connections[websocket] = subscriber
+        return subscriber
+
+    def disconnect(self, websocket: WebSocket):
+        subscriber = self.connections.pop(websocket, None)
+        if subscriber is None:
+            return
+        for purchase_id in subscriber.purchase_ids:
+            watchers = self.by_purchase.get(purchase_id)
+            if watchers is not None:
+                watchers.discard(subscriber)
+                if not watchers:
+                    del self.by_purchase[purchase_id]
+        subscriber.purchase_ids.clear()
+        if subscriber.task is not asyncio.current_task():
+            subscriber.task.cancel()
+
+    def subscribe(self, subscriber: Subscriber, purchase_id: int) -> bool:
+        """Add purchase_id to the socket's subscriptions; False when it already has max_subscriptions."""
+        if purchase_id in subscriber.purchase_ids:
+            return True
+        if len(subscriber.purchase_ids) >= self.max_subscriptions:
+            return False
+        subscriber.purchase_ids.add(purchase_id)
+        self.by_purchase.setdefault(purchase_id, set()).add(subscriber)
+        return True
+
+    def unsubscribe(self, subscriber: Subscriber, purchase_id: int):
+        subscriber.purchase_ids.discard(purchase_id)
+        watchers = self.by_purchase.get(purchase_id)
+        if watchers is not None:
+            watchers.discard(subscriber)
+            if not watchers:
+                del self.by_purchase[purchase_id]
+
+    def is_watched(self, purchase_id: int) -> bool:
+        return purchase_id in self.by_purchase
+
+    def broadcast_update(self, purchase_id: int, message: str) -> int:
+        """Queue message for every socket subscribed to purchase_id; returns how many got it."""
+        queued = 0
+        for subscriber in list(self.by_purchase.get(purchase_id, ())):
+            if self.send(subscriber, message):
+                queued += 1
+        return queued
+
+    def send(self, subscriber: Subscriber, message: str) -> bool:
+        """Queue message for one socket, applying the slow-consumer policy when its queue is full."""
+        if len(subscriber.pending) < self.queue_size:
+            subscriber.push(message)
+            return True
+
+        if self.policy == SlowConsumerPolicy.DISCONNECT:
+            self.slow_disconnects += 1
+            logger.info(f"Disconnecting slow WebSocket with {len(subscriber.pending)} queued messages")
+            self.disconnect(subscriber.websocket)
+            asyncio.create_task(self._close(subscriber.websocket, SLOW_CONSUMER_CLOSE_CODE))
+            return False
+
+        subscriber.pending.popleft()
+        subscriber.push(message)
+        subscriber.dropped += 1
+        self.dropped += 1
+        return True
+
+    async def _send(self, subscriber: Subscriber):
+        websocket = subscriber.websocket
+        try:
+            while True:
+                message = await subscriber.next_message()
+                await websocket.send_text(message)
+                subscriber.last_sent = time.monotonic()
+                self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info(f"Dropping WebSocket after failed send: {e}")
+            self.disconnect(websocket)
+
+    async def _close(self, websocket: WebSocket, code: int):
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            idle_since = time.monotonic() - self.heartbeat_interval
+            for subscriber in list(self.connections.values()):
+                # A client with messages still queued is not idle; don't add to its backlog.
+                if subscriber.last_sent <= idle_since and not subscriber.pending:
+                    subscriber.push(HEARTBEAT)
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self.connections),
+            "watched_purchases": len(self.by_purchase),
+            "subscriptions": sum(len(watchers) for watchers in self.by_purchase.values()),
+            "queued": sum(len(subscriber.pending) for subscriber in self.connections.values()),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "slow_disconnects": self.slow_disconnects,
+            "policy": self.policy.value,
+        }
@@ -0,0 +1,412 @@
+import asyncio
+
+import pytest
+
+from response_cache import ResponseCache
+
+
+def run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+class Fetcher:
+    """fetch() for ResponseCache that blocks until released, counting calls."""
+
+    def __init__(self, value="value", error=None):
+        self.value = value
+        self.error = error
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def fetch(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def keep(seconds):
+    return lambda value: seconds
+
+
+def test_response_cache_coalesces_concurrent_misses():
+    cache = ResponseCache()
+    fetcher = Fetcher()
+
+    async def scenario():
+        waiters = [
+            asyncio.ensure_future(cache.get_or_fetch(("wallet", 1), fetcher.fetch, keep(60))) for _ in range(10)
+        ]
+        await asyncio.sleep(0)
+        fetcher.release.set()
+        values = await asyncio.gather(*waiters)
+        return values, await cache.get_or_fetch(("wallet", 1), fetcher.fetch, keep(60))
+
+    values, cached = run(scenario())
+    assert values == ["value"] * 10 and cached == "value"
+    assert fetcher.calls == 1
+    stats = cache.stats()
+    assert (stats["misses"], stats["coalesced"], stats["hits"], stats["inflight"]) == (1, 9, 1, 0)
+
+
+def test_response_cache_propagates_errors_to_every_waiter():
+    cache = ResponseCache()
+    failing = Fetcher(error=ConnectionError("orders is down"))
+
+    async def scenario():
+        waiters = [
+            asyncio.ensure_future(cache.get_or_fetch(("purchase", 1), failing.fetch, keep(60))) for _ in range(3)
+        ]
+        await asyncio.sleep(0)
+        failing.release.set()
+        return await asyncio.gather(*waiters, return_exceptions=True)
+
+    outcomes = run(scenario())
+    assert all(isinstance(outcome, ConnectionError) for outcome in outcomes)
+    assert failing.calls == 1 and cache.stats()["size"] == 0 and cache.stats()["inflight"] == 0
+
+    # The error is not cached; the next lookup goes downstream again.
+    recovered = Fetcher()
+    recovered.release.set()
+    assert run(cache.get_or_fetch(("purchase", 1), recovered.fetch, keep(60))) == "value"
+    assert recovered.calls == 1
+
+
+def test_response_cache_invalidation_during_fetch_drops_stale_result():
+    cache = ResponseCache()
+    stale = Fetcher(value="stale")
+    fresh = Fetcher(value="fresh")
+    fresh.release.set()
+
+    async def scenario():
+        waiter = asyncio.ensure_future(cache.get_or_fetch(("wallet", 1), stale.fetch, keep(60)))
+        await asyncio.sleep(0)
+        # A write lands while the read is in flight.
+        cache.invalidate(("wallet", 1))
+        after_write = await cache.get_or_fetch(("wallet", 1), fresh.fetch, keep(60))
+        stale.release.set()
+        return await waiter, after_write, await cache.get_or_fetch(("wallet", 1), fresh.fetch, keep(60))
+
+    first, after_write, cached = run(scenario())
+    # The caller that started before the write still gets its answer, but it is not stored.
+    assert first == "stale"
+    assert after_write == "fresh" and cached == "fresh"
+    assert stale.calls == 1 and fresh.calls == 1
+
+
+def test_response_cache_ttl_eviction_and_clear():
+    cache = ResponseCache(max_entries=2)
+
+    async def value(key, seconds=60):
+        async def fetch():
+            return key
+        return await cache.get_or_fetch(key, fetch, keep(seconds))
+
+    async def scenario():
+        await value(("purchase", 1), seconds=0)
+        for n in (2, 3, 4):
+            await value(("purchase", n))
+
+    run(scenario())
+    stats = cache.stats()
+    assert (stats["size"], stats["evictions"]) == (2, 1)
+    cache.invalidate_kind("wallet")
+    assert cache.stats()["size"] == 2
+    cache.clear()
+    assert cache.stats()["size"] == 0 and cache.stats()["misses"] == 4
+
+
+async def serve_keepalive(connections: list):
+    """Minimal HTTP/1.1 server on a free port that keeps connections open and answers "ok"."""
+    async def handle(reader, writer):
+        connections.append(writer)
+        try:
+            while await reader.readuntil(b"\r\n\r\n"):
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+def test_downstream_reuses_keepalive_connections():
+    from downstream import Downstream
+
+    async def scenario():
+        accepted = []
+        server = await serve_keepalive(accepted)
+        port = server.sockets[0].getsockname()[1]
+        downstream = Downstream("payments", f"http://127.0.0.1:{port}", max_connections=4)
+        await downstream.start()
+        try:
+            for n in range(5):
+                assert (await downstream.get(f"/wallets/{n}")).text == "ok"
+            await asyncio.gather(*(downstream.get("/wallets/1") for _ in range(8)))
+            return downstream.stats(), len(accepted)
+        finally:
+            await downstream.stop()
+            server.close()
+
+    stats, accepted = run(scenario())
+    assert stats["requests"] == 13 and stats["errors"] == 0 and stats["in_flight"] == 0
+    assert stats["connections_opened"] == accepted <= 4
+    assert stats["max_connections"] == 4 and stats["keepalive_expiry"] == 30.0
+
+
+def test_downstream_timeouts_and_error_counters():
+    import httpx
+    from downstream import Downstream
+
+    seen = []
+
+    async def handler(request):
+        seen.append((request.url.path, request.extensions["timeout"], downstream.stats()["in_flight"]))
+        if request.url.path == "/down":
+            raise httpx.ConnectError("refused", request=request)
+        if request.url.path == "/busy":
+            raise httpx.PoolTimeout("no free connection", request=request)
+        return httpx.Response(200, json={})
+
+    downstream = Downstream("orders", "http://orders", timeout=10.0, connect_timeout=2.0, pool_timeout=1.0)
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await downstream.get("/purchases/1")
+        await downstream.start()
+        downstream.client = httpx.AsyncClient(
+            base_url=downstream.base_url, timeout=downstream.timeout, transport=httpx.MockTransport(handler)
+        )
+        try:
+            await downstream.get("/purchases/1")
+            await downstream.post("/purchases/batch", json={}, timeout=30.0)
+            with pytest.raises(httpx.ConnectError):
+                await downstream.get("/down")
+            with pytest.raises(httpx.PoolTimeout):
+                await downstream.get("/busy")
+        finally:
+            await downstream.stop()
+
+    run(scenario())
+    timeouts = {path: timeout for path, timeout, _ in seen}
+    assert timeouts["/purchases/1"] == {"connect": 2.0, "read": 10.0, "write": 10.0, "pool": 1.0}
+    assert timeouts["/purchases/batch"] == {"connect": 2.0, "read": 30.0, "write": 30.0, "pool": 1.0}
+    assert all(in_flight == 1 for _, _, in_flight in seen)
+    stats = downstream.stats()
+    assert (stats["requests"], stats["errors"], stats["pool_timeouts"], stats["in_flight"]) == (4, 2, 1, 0)
+
+
+class FakeStatusMessage:
+    def __init__(self, body: bytes, content_type: str):
+        self.body = body
+        self.content_type = content_type
+
+
+class FakeStatusQueue:
+    def __init__(self, messages, consumed: asyncio.Event):
+        self.messages = messages
+        self.consumed = consumed
+        self.bound_to = None
+
+    async def bind(self, exchange):
+        self.bound_to = exchange
+
+    def iterator(self, no_ack=False):
+        assert no_ack
+        queue = self
+
+        class Iterator:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            def __aiter__(self):
+                return self.messages()
+
+            async def messages(self):
+                for message in queue.messages:
+                    yield message
+                queue.consumed.set()
+                # Stay subscribed, like a live queue with nothing more to deliver.
+                await asyncio.Event().wait()
+
+        return Iterator()
+
+
+class FakeStatusConnection:
+    def __init__(self, queue):
+        self.queue = queue
+        self.declared = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def channel(self):
+        return self
+
+    async def declare_exchange(self, name, type, durable):
+        self.declared["exchange"] = (name, type, durable)
+        return name
+
+    async def declare_queue(self, exclusive, arguments):
+        self.declared["queue"] = (exclusive, arguments)
+        return self.queue
+
+
+def test_status_events_decode_and_survive_bad_messages(monkeypatch):
+    import aio_pika
+    import codec
+    import status_events
+
+    consumed = asyncio.Event()
+    finished = codec.encode("status", {"purchase_id": 1, "status": "FINISHED"}, codec.MSGPACK)
+    queue = FakeStatusQueue([
+        FakeStatusMessage(finished, codec.MSGPACK),
+        FakeStatusMessage(b"not json", codec.JSON),
+        FakeStatusMessage(b'{"purchase_id": 2, "status": "CANCELLED", "reason": "INSUFFICIENT_FUNDS"}', None),
+    ], consumed)
+    connection = FakeStatusConnection(queue)
+
+    async def connect_robust(url):
+        return connection
+    monkeypatch.setattr(aio_pika, "connect_robust", connect_robust)
+
+    received = []
+
+    async def handler(data):
+        received.append(data)
+
+    async def scenario():
+        task = asyncio.ensure_future(status_events.subscribe("amqp://test", "statuses", handler, max_backlog=50))
+        await asyncio.wait_for(consumed.wait(), timeout=5)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    run(scenario())
+    assert received == [
+        {"purchase_id": 1, "status": "FINISHED", "reason": None},
+        {"purchase_id": 2, "status": "CANCELLED", "reason": "INSUFFICIENT_FUNDS"},
+    ]
+    assert connection.declared["exchange"] == ("statuses", aio_pika.ExchangeType.FANOUT, True)
+    assert connection.declared["queue"] == (True, {"x-max-length": 50})
+    assert queue.bound_to == "statuses"
+
+
+class FakeWebSocket:
+    def __init__(self, blocked=False, fail=False):
+        self.sent = []
+        self.closed_with = None
+        self.fail = fail
+        self.unblocked = asyncio.Event()
+        if not blocked:
+            self.unblocked.set()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        await self.unblocked.wait()
+        if self.fail:
+            raise ConnectionError("peer is gone")
+        self.sent.append(message)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_fanout_drop_oldest_keeps_newest_messages():
+    from fanout import ConnectionManager
+
+    manager = ConnectionManager(queue_size=2, policy="drop_oldest", heartbeat_interval=0)
+    slow, fast = FakeWebSocket(blocked=True), FakeWebSocket()
+
+    async def scenario():
+        for websocket in (slow, fast):
+            manager.subscribe(await manager.connect(websocket), 7)
+        await settle()
+        for n in range(5):
+            assert manager.broadcast_update(7, f"m{n}") == 2
+            await settle()
+        slow.unblocked.set()
+        await settle()
+        stats = manager.stats()
+        await manager.stop()
+        return stats
+
+    stats = run(scenario())
+    # The slow socket holds "m0" in send_text while m1..m4 pile up behind it.
+    assert fast.sent == ["m0", "m1", "m2", "m3", "m4"]
+    assert slow.sent == ["m0", "m3", "m4"]
+    assert stats["dropped"] == 2 and stats["slow_disconnects"] == 0 and stats["connections"] == 2
+
+
+def test_fanout_disconnect_policy_closes_slow_socket():
+    from fanout import SLOW_CONSUMER_CLOSE_CODE, ConnectionManager
+
+    manager = ConnectionManager(queue_size=2, policy="disconnect", heartbeat_interval=0)
+    slow, fast = FakeWebSocket(blocked=True), FakeWebSocket()
+
+    async def scenario():
+        for websocket in (slow, fast):
+            manager.subscribe(await manager.connect(websocket), 7)
+        await settle()
+        delivered = []
+        for n in range(4):
+            delivered.append(manager.broadcast_update(7, f"m{n}"))
+            await settle()
+        stats = manager.stats()
+        await manager.stop()
+        return delivered, stats
+
+    delivered, stats = run(scenario())
+    assert delivered == [2, 2, 2, 1]
+    assert slow.closed_with == SLOW_CONSUMER_CLOSE_CODE and fast.closed_with is None
+    assert fast.sent == ["m0", "m1", "m2", "m3"]
+    assert stats["slow_disconnects"] == 1 and stats["connections"] == 1
+    assert stats["subscriptions"] == 1
+
+
+def test_fanout_heartbeat_pings_idle_sockets():
+    from fanout import HEARTBEAT, ConnectionManager
+
+    manager = ConnectionManager(heartbeat_interval=0.05)
+    idle = FakeWebSocket()
+
+    async def scenario():
+        manager.start()
+        await manager.connect(idle)
+        await asyncio.sleep(0.2)
+        await manager.stop()
+
+    run(scenario())
+    assert idle.sent and set(idle.sent) == {HEARTBEAT}
+
+
+def test_fanout_subscription_limit_and_failed_send():
+    from fanout import ConnectionManager
+
+    manager = ConnectionManager(max_subscriptions=2, heartbeat_interval=0)
+    broken = FakeWebSocket(fail=True)
+
+    async def scenario():
+        subscriber = await manager.connect(broken)
+        assert manager.subscribe(subscriber, 1) and manager.subscribe(subscriber, 2)
+        assert manager.subscribe(subscriber, 1)
+        assert not manager.subscribe(subscriber, 3)
+        manager.broadcast_update(1, "m0")
+        await settle()
+
+    run(scenario())
+    assert manager.stats()["connections"] == 0
+    assert not manager.is_watched(1) and not manager.is_watched(2)
@@ -0,0 +1,122 @@
+"""Gateway latency with a shared keep-alive client vs. a new client per request.
+
+Usage: python http_pool_bench.py [--requests 2000] [--concurrency 50]
+A stub PaymentsService runs in a child process on localhost; GET /api/wallet/{id} is
+sent through the gateway app in-process, so only the gateway-to-service hop goes over
+TCP. The "per-request" mode opens a fresh httpx.AsyncClient for every call, which is
+what the handlers used to do.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import statistics
+import time
+
+import httpx
+import uvicorn
+
+
+async def stub_app(scope, receive, send):
+    if scope["type"] != "http":
+        return
+    user_id = int(scope["path"].rsplit("/", 1)[-1])
+    body = json.dumps({"user_id": user_id, "money": 100.0}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def serve_stub(port: int):
+    uvicorn.run(stub_app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("Stub service did not start")
+
+
+async def run(mode: str, requests: int, concurrency: int) -> dict:
+    import main
+    from downstream import Downstream
+
+    # httpx logs every request at INFO, which would dominate the timings.
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    # Both modes run in this process; wallets cached by the first must not answer for the second.
+    main.cache.clear()
+
+    class PerRequestDownstream(Downstream):
+        async def request(self, method: str, path: str, timeout: float = None, **kwargs) -> httpx.Response:
+            async with httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout) as client:
+                return await client.request(method, path, extensions={"trace": self._trace}, **kwargs)
+
+    if mode == "per-request":
+        main.payments = PerRequestDownstream("payments", main.PAYMENTS_SERVICE_URL)
+    else:
+        main.payments = main.make_downstream("payments", main.PAYMENTS_SERVICE_URL)
+    await main.payments.start()
+
+    latencies = []
+    next_id = iter(range(requests))
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as gateway:
+        async def worker():
+            for user_id in next_id:
+                started = time.perf_counter()
+                response = await gateway.get(f"/api/wallet/{user_id}")
+                latencies.append(time.perf_counter() - started)
+                assert response.status_code == 200, response.text
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    stats = main.payments.stats()
+    await main.payments.stop()
+    latencies.sort()
+    return {
+        "mode": mode,
+        "rps": round(requests / elapsed),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+        "connections": stats["connections_opened"],
+    }
+
+
+def main(args):
+    port = free_port()
+    os.environ["PAYMENTS_SERVICE_URL"] = f"http://127.0.0.1:{port}"
+    stub = multiprocessing.Process(target=serve_stub, args=(port,), daemon=True)
+    stub.start()
+    try:
+        wait_for_port(port)
+        for mode in ("per-request", "shared"):
+            print(asyncio.run(run(mode, args.requests, args.concurrency)))
+    finally:
+        stub.terminate()
+        stub.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    main(parser.parse_args())
@@ -1,15 +1,21 @@
 import os
+import asyncio
 import httpx
 import logging
-from fastapi import FastAPI, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Header, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Optional, Dict, List
 from pydantic import BaseModel
+from datetime import datetime
 import json
 
 import schemas
+import status_events
 from config import Settings
+from downstream import Downstream
+from fanout import ConnectionManager, Subscriber
+from response_cache import ResponseCache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -38,28 +44,103 @@ app.add_middleware(
 ORDERS_SERVICE_URL = settings.PURCHASE_SERVICE_URL
 PAYMENTS_SERVICE_URL = settings.WALLET_SERVICE_URL
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[int, List[WebSocket]] = {}
+def make_downstream(name: str, base_url: str) -> Downstream:
+    return Downstream(
+        name,
+        base_url,
+        timeout=settings.HTTP_TIMEOUT,
+        connect_timeout=settings.HTTP_CONNECT_TIMEOUT,
+        pool_timeout=settings.HTTP_POOL_TIMEOUT,
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY
+    )
 
-    async def connect(self, websocket: WebSocket, purchase_id: int):
-        await websocket.accept()
-        if purchase_id not in self.active_connections:
-            self.active_connections[purchase_id] = []
-        self.active_connections[purchase_id].append(websocket)
+orders = make_downstream("orders", ORDERS_SERVICE_URL)
+payments = make_downstream("payments", PAYMENTS_SERVICE_URL)
 
-    def disconnect(self, websocket: WebSocket, purchase_id: int):
-        if purchase_id in self.active_connections:
-            self.active_connections[purchase_id].remove(websocket)
-            if not self.active_connections[purchase_id]:
-                del self.active_connections[purchase_id]
+@app.on_event("startup")
+async def startup():
+    await orders.start()
+    await payments.start()
+    manager.start()
+    app.state.status_events_task = asyncio.create_task(status_events.subscribe(
+        settings.RABBITMQ_URL,
+        settings.PURCHASE_STATUS_EXCHANGE,
+        push_status_update,
+        max_backlog=settings.STATUS_EVENTS_MAX_BACKLOG
+    ))
 
-    async def broadcast_update(self, purchase_id: int, message: str):
-        if purchase_id in self.active_connections:
-            for connection in self.active_connections[purchase_id]:
-                await connection.send_text(message)
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.status_events_task.cancel()
+    await manager.stop()
+    await orders.stop()
+    await payments.stop()
 
-manager = ConnectionManager()
+@app.exception_handler(httpx.RequestError)
+async def downstream_unavailable(request: Request, exc: httpx.RequestError):
+    logger.error(f"Downstream request failed: {exc!r}")
+    return JSONResponse(status_code=502, content={"detail": "Downstream service unavailable"})
+
+@app.get("/http/pool/stats")
+async def http_pool_stats():
+    return {"orders": orders.stats(), "payments": payments.stats()}
+
+cache = ResponseCache(max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES)
+TERMINAL_STATUSES = (schemas.OrderStatus.FINISHED.value, schemas.OrderStatus.CANCELLED.value)
+
+async def cached_get(downstream: Downstream, key: tuple, path: str, ttl) -> tuple:
+    """GET path through the response cache; returns (status_code, JSON body of a 200 or None)."""
+    async def fetch():
+        response = await downstream.get(path)
+        return response.status_code, response.json() if response.status_code == 200 else None
+    return await cache.get_or_fetch(key, fetch, ttl)
+
+def wallet_ttl(value: tuple) -> float:
+    status_code, _ = value
+    return settings.WALLET_CACHE_TTL if status_code == 200 else 0
+
+def purchase_ttl(value: tuple) -> float:
+    status_code, purchase = value
+    if status_code != 200:
+        return 0
+    if purchase["status"] in TERMINAL_STATUSES:
+        return settings.PURCHASE_CACHE_TERMINAL_TTL
+    return settings.PURCHASE_CACHE_TTL
+
+async def fetch_purchase(purchase_id: int) -> tuple:
+    return await cached_get(orders, ("purchase", purchase_id), f"/purchases/{purchase_id}", purchase_ttl)
+
+@app.get("/cache/stats")
+async def response_cache_stats():
+    return cache.stats()
+
+manager = ConnectionManager(
+    queue_size=settings.WS_SEND_QUEUE_SIZE,
+    policy=settings.WS_SLOW_CONSUMER_POLICY,
+    heartbeat_interval=settings.WS_HEARTBEAT_INTERVAL,
+    max_subscriptions=settings.WS_MAX_SUBSCRIPTIONS
+)
+
+def purchase_update(purchase_id: int, status: str, reason: Optional[str]) -> str:
+    return json.dumps({
+        "type": "purchase_update",
+        "purchase_id": purchase_id,
+        "status": status,
+        "status_reason": reason
+    })
+
+async def push_status_update(data: dict):
+    """Send a status change from the broker to the sockets watching that purchase, if any."""
+    purchase_id = int(data["purchase_id"])
+    cache.invalidate(("purchase", purchase_id))
+    if manager.is_watched(purchase_id):
+        manager.broadcast_update(purchase_id, purchase_update(purchase_id, data["status"], data.get("reason")))
+
+@app.get("/ws/stats")
+async def websocket_stats():
+    return manager.stats()
 
 # Data Models
 class WalletCreate(BaseModel):
@@ -74,76 +155,168 @@ async def create_wallet(wallet: WalletCreate):
     """
     Create a new wallet for a user.
     """
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        response = await client.post(f"{PAYMENTS_SERVICE_URL}/wallets", json=wallet.dict())
-        if response.status_code != 200:
-            raise HTTPException(status_code=response.status_code, detail="Failed to create wallet")
-        return response.json()
+    response = await payments.post("/wallets", json=wallet.dict())
+    cache.invalidate(("wallet", wallet.user_id))
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail="Failed to create wallet")
+    return response.json()
 
 @app.get("/api/wallet/{user_id}", response_model=schemas.WalletDetails)
 async def get_wallet(user_id: int):
     """
     Get wallet information for a specific user.
     """
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        response = await client.get(f"{PAYMENTS_SERVICE_URL}/wallets/{user_id}")
-        if response.status_code == 404:
-            raise HTTPException(status_code=404, detail="Wallet not found")
-        return response.json()
+    status_code, wallet = await cached_get(payments, ("wallet", user_id), f"/wallets/{user_id}", wallet_ttl)
+    if status_code == 404:
+        raise HTTPException(status_code=404, detail="Wallet not found")
+    if status_code != 200:
+        raise HTTPException(status_code=status_code, detail="Failed to get wallet")
+    return wallet
 
 @app.post("/api/wallet/{user_id}/deposit", response_model=schemas.WalletDetails)
 async def deposit_money(user_id: int, deposit: WalletDeposit):
     """
     Deposit money into a user's wallet.
     """
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        response = await client.post(f"{PAYMENTS_SERVICE_URL}/wallets/{user_id}/deposit", json=deposit.dict())
-        if response.status_code == 404:
-            raise HTTPException(status_code=404, detail="Wallet not found for deposit")
-        if response.status_code != 200:
-            raise HTTPException(status_code=response.status_code, detail="Failed to deposit money")
-        return response.json()
+    response = await payments.post(f"/wallets/{user_id}/deposit", json=deposit.dict())
+    cache.invalidate(("wallet", user_id))
+    if response.status_code == 404:
+        raise HTTPException(status_code=404, detail="Wallet not found for deposit")
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail="Failed to deposit money")
+    return response.json()
+
+async def forward_bulk(request: Request, path: str) -> Response:
+    # The body is streamed through unparsed, so large JSON and NDJSON uploads pass as they are.
+    headers = {"Content-Type": request.headers.get("content-type", "application/json")}
+    response = await payments.post(
+        path, content=request.stream(), headers=headers, timeout=settings.HTTP_BULK_TIMEOUT
+    )
+    # The user_ids are in the streamed body the gateway never parses, so drop all cached wallets.
+    cache.invalidate_kind("wallet")
+    if response.status_code in (400, 422):
+        raise HTTPException(status_code=response.status_code, detail=response.json().get("detail"))
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail="Failed to process batch")
+    return Response(content=response.content, media_type="application/json")
+
+@app.post("/api/wallet/batch", response_model=schemas.WalletBatchResult)
+async def create_wallets_batch(request: Request):
+    """
+    Create many wallets from {"wallets": [{"user_id": int}, ...]} or an application/x-ndjson stream.
+    Users that already have a wallet are reported as "exists".
+    """
+    return await forward_bulk(request, "/wallets/batch")
+
+@app.post("/api/wallet/deposits/batch", response_model=schemas.DepositBatchResult)
+async def deposit_batch(request: Request):
+    """
+    Credit many wallets from {"deposits": [{"user_id": int, "amount": float}, ...]} or an application/x-ndjson stream.
+    The batch is applied all or nothing.
+    """
+    return await forward_bulk(request, "/wallets/deposits/batch")
+
+async def watch(subscriber: Subscriber, purchase_id: int):
+    """Subscribe a socket to a purchase and queue its current status, so a change made before is not missed."""
+    if not manager.subscribe(subscriber, purchase_id):
+        manager.send(subscriber, json.dumps({"type": "error", "detail": "Too many subscriptions"}))
+        return
+    try:
+        status_code, purchase = await fetch_purchase(purchase_id)
+    except httpx.RequestError as e:
+        logger.warning(f"Could not read status of purchase {purchase_id}: {e!r}")
+        return
+    if status_code == 200:
+        manager.send(subscriber, purchase_update(purchase_id, purchase["status"], purchase.get("status_reason")))
 
 # WebSocket endpoint for real-time updates
 @app.websocket("/ws/{purchase_id}")
 async def websocket_endpoint(websocket: WebSocket, purchase_id: int):
-    await manager.connect(websocket, purchase_id)
+    """
+    Push purchase_update messages for the purchase in the path as its status changes.
+    More purchases can be watched on the same socket by sending
+    {"action": "subscribe", "purchase_id": int}, and dropped with "unsubscribe".
+    """
+    subscriber = await manager.connect(websocket)
     try:
+        await watch(subscriber, purchase_id)
         while True:
-            data = await websocket.receive_text()
-            # Handle any incoming messages if needed
+            try:
+                request = json.loads(await websocket.receive_text())
+                action, requested_id = request["action"], int(request["purchase_id"])
+            except (ValueError, KeyError, TypeError):
+                manager.send(subscriber, json.dumps({"type": "error", "detail": "Invalid request"}))
+                continue
+            if action == "subscribe":
+                await watch(subscriber, requested_id)
+            elif action == "unsubscribe":
+                manager.unsubscribe(subscriber, requested_id)
     except WebSocketDisconnect:
-        manager.disconnect(websocket, purchase_id)
+        pass
+    finally:
+        manager.disconnect(websocket)
 
 @app.post("/api/purchase", response_model=schemas.PurchaseRecord)
-async def create_purchase(purchase: schemas.NewPurchaseContract):
+async def create_purchase(purchase: schemas.NewPurchaseContract, idempotency_key: Optional[str] = Header(None)):
+    """
+    Create a new purchase. Retries that send the same Idempotency-Key get the original purchase back.
+    """
+    headers = {"Idempotency-Key": idempotency_key} if idempotency_key else {}
+    response = await orders.post("/purchases", json=purchase.dict(), headers=headers)
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail="Failed to create purchase")
+    created = response.json()
+    cache.invalidate(("purchase", created["id"]))
+    return created
+
+@app.post("/api/purchases/batch", response_model=schemas.PurchaseBatchResult)
+async def create_purchases_batch(batch: schemas.NewPurchaseBatch):
     """
-    Create a new purchase.
+    Create many purchases in one call. Each item gets its own created/rejected result.
     """
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        response = await client.post(f"{ORDERS_SERVICE_URL}/purchases", json=purchase.dict())
-        if response.status_code != 200:
-            raise HTTPException(status_code=response.status_code, detail="Failed to create purchase")
-        return response.json()
+    response = await orders.post("/purchases/batch", json=batch.dict(), timeout=settings.HTTP_BATCH_TIMEOUT)
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail="Failed to create purchases")
+    return response.json()
 
 @app.get("/api/purchase/{purchase_id}", response_model=schemas.PurchaseRecord)
 async def get_purchase_details(purchase_id: int):
     """
     Get details of a specific purchase.
     """
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        response = await client.get(f"{ORDERS_SERVICE_URL}/purchases/{purchase_id}")
-        if response.status_code == 404:
-            raise HTTPException(status_code=404, detail="Purchase not found")
-        return response.json()
+    status_code, purchase = await fetch_purchase(purchase_id)
+    if status_code == 404:
+        raise HTTPException(status_code=404, detail="Purchase not found")
+    if status_code != 200:
+        raise HTTPException(status_code=status_code, detail="Failed to get purchase")
+    return purchase
 
 @app.get("/api/purchases", response_model=schemas.PurchaseList)
-async def get_all_purchases():
+async def get_all_purchases(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    user_id: Optional[int] = None,
+    status: Optional[schemas.OrderStatus] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None
+):
     """
-    Get a list of all purchases.
+    Get a page of purchases, newest first. Pass next_cursor back as cursor to get the next page.
     """
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        response = await client.get(f"{ORDERS_SERVICE_URL}/purchases")
-        if response.status_code != 200:
-            raise HTTPException(status_code=response.status_code, detail="Failed to get purchases")
-        return {"purchases": response.json()}
+    params = {
+        "limit": limit,
+        "cursor": cursor,
+        "user_id": user_id,
+        "status": status.value if status else None,
+        "created_from": created_from.isoformat() if created_from else None,
+        "created_to": created_to.isoformat() if created_to else None,
+    }
+    response = await orders.get(
+        "/purchases",
+        params={key: value for key, value in params.items() if value is not None}
+    )
+    if response.status_code in (400, 422):
+        raise HTTPException(status_code=response.status_code, detail=response.json().get("detail"))
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail="Failed to get purchases")
+    return response.json()
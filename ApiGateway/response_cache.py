@@ -0,0 +1,98 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable
+
+
+class ResponseCache:
+    """Bounded in-process LRU cache of downstream reads with single-flight fetches.
+
+    Keys are tuples whose first item names the kind of resource, e.g.
+    ("purchase", 42). On a miss the first caller starts the fetch and every
+    concurrent caller for the same key awaits that one fetch instead of going
+    downstream too. ttl(value) decides how long a fetched value is kept; 0 keeps
+    it out of the cache. The fetch runs in its own task, so a caller that goes
+    away does not cancel it for the others.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable], ttl: Callable[[object], float]):
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+
+        flight = self._inflight.get(key)
+        if flight is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            flight = asyncio.ensure_future(self._fill(key, fetch, ttl))
+            # Retrieve the error even when every caller has gone, so it is not logged as unhandled.
+            flight.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self._inflight[key] = flight
+        return await asyncio.shield(flight)
+
+    def invalidate(self, key: Hashable):
+        """Drop key, and detach a fetch in flight so its possibly stale result is not stored."""
+        self.invalidations += 1
+        self._entries.pop(key, None)
+        self._inflight.pop(key, None)
+
+    def invalidate_kind(self, kind: str):
+        """Drop every key of one kind, for writes that touch keys the gateway cannot list."""
+        self.invalidations += 1
+        for key in [key for key in self._entries if key[0] == kind]:
+            del self._entries[key]
+        for key in [key for key in self._inflight if key[0] == kind]:
+            del self._inflight[key]
+
+    def clear(self):
+        """Drop every entry and detach every fetch in flight; the counters are kept."""
+        self._entries.clear()
+        self._inflight.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+        }
+
+    async def _fill(self, key: Hashable, fetch: Callable[[], Awaitable], ttl: Callable[[object], float]):
+        flight = asyncio.current_task()
+        try:
+            value = await fetch()
+        finally:
+            current = self._inflight.get(key) is flight
+            if current:
+                del self._inflight[key]
+
+        seconds = ttl(value) if current else 0
+        if seconds > 0:
+            self._entries[key] = (value, time.monotonic() + seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
@@ -1,7 +1,7 @@
 from datetime import datetime
 from enum import Enum
 from pydantic import BaseModel
-from typing import List
+from typing import Any, List, Optional
 
 
 class OrderStatus(str, Enum):
@@ -30,14 +30,54 @@ class NewPurchaseContract(BaseModel):
     description: str
 
 
+class NewPurchaseBatch(BaseModel):
+    purchases: List[Any]
+
+
 class PurchaseRecord(BaseModel):
     id: int
     user_id: int
     amount: float
     description: str
     status: OrderStatus
+    status_reason: Optional[str] = None
     created_at: datetime
 
 
 class PurchaseList(BaseModel):
-    purchases: List[PurchaseRecord] 
\ No newline at end of file
+    purchases: List[PurchaseRecord]
+    next_cursor: Optional[str] = None
+
+
+class PurchaseBatchItemResult(BaseModel):
+    index: int
+    status: str
+    purchase: Optional[PurchaseRecord] = None
+    errors: Optional[List[Any]] = None
+
+
+class PurchaseBatchResult(BaseModel):
+    created: int
+    rejected: int
+    results: List[PurchaseBatchItemResult]
+
+
+class BulkItemResult(BaseModel):
+    index: int
+    user_id: Optional[int] = None
+    status: str
+    errors: Optional[List[Any]] = None
+
+
+class WalletBatchResult(BaseModel):
+    created: int
+    existing: int
+    rejected: int
+    results: List[BulkItemResult]
+
+
+class DepositBatchResult(BaseModel):
+    credited: int
+    not_found: int
+    rejected: int
+    results: List[BulkItemResult]
@@ -0,0 +1,39 @@
+import asyncio
+import logging
+
+import aio_pika
+
+import codec
+
+logger = logging.getLogger(__name__)
+
+
+async def subscribe(url: str, exchange_name: str, handler, max_backlog: int = 10000):
+    """Await handler(data) for every purchase status change published to the fanout exchange.
+
+    Each gateway instance binds its own exclusive, server-named queue, so every instance
+    sees every change. Messages are not acked: a missed push only means the client reads
+    the status itself. When the gateway falls behind, the broker drops the oldest events
+    beyond max_backlog. Connection failures are retried forever.
+    """
+    while True:
+        try:
+            connection = await aio_pika.connect_robust(url)
+            async with connection:
+                channel = await connection.channel()
+                exchange = await channel.declare_exchange(exchange_name, aio_pika.ExchangeType.FANOUT, durable=True)
+                queue = await channel.declare_queue(exclusive=True, arguments={"x-max-length": max_backlog})
+                await queue.bind(exchange)
+                logger.info(f"Subscribed to {exchange_name}")
+
+                async with queue.iterator(no_ack=True) as messages:
+                    async for message in messages:
+                        try:
+                            await handler(codec.decode("status", message.body, message.content_type))
+                        except Exception as e:
+                            logger.error(f"Error handling status event: {e}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in status subscription: {e}")
+            await asyncio.sleep(5)
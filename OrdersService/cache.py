@@ -0,0 +1,82 @@
+import time
+from collections import OrderedDict
+
+import schemas
+
+TERMINAL_STATUSES = (schemas.OrderStatus.FINISHED, schemas.OrderStatus.CANCELLED)
+
+
+class PurchaseCache:
+    """Bounded in-process LRU cache of purchase reads with per-status TTL.
+
+    Terminal purchases never change again, so they are kept for terminal_ttl seconds.
+    Purchases that can still change are kept for ttl seconds only.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 1.0, terminal_ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.terminal_ttl = terminal_ttl
+        self._entries = OrderedDict()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, purchase_id: int):
+        entry = self._entries.get(purchase_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        purchase, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[purchase_id]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(purchase_id)
+        self.hits += 1
+        return purchase
+
+    def generation(self) -> int:
+        """Token to take before a database read and hand back to put()."""
+        return self._generation
+
+    def put(self, purchase: schemas.Purchase, generation: int = None):
+        # A status change applied while the caller was reading makes its row stale.
+        if generation is not None and generation != self._generation:
+            return
+        self._store(purchase)
+
+    def set_status(self, purchase_id: int, status: schemas.OrderStatus, reason: str = None):
+        self._generation += 1
+        entry = self._entries.get(purchase_id)
+        if entry is not None:
+            changes = {"status": status} if reason is None else {"status": status, "status_reason": reason}
+            self._store(entry[0].model_copy(update=changes))
+
+    def invalidate(self, purchase_id: int):
+        self._generation += 1
+        self._entries.pop(purchase_id, None)
+
+    def clear(self):
+        self._generation += 1
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _store(self, purchase: schemas.Purchase):
+        ttl = self.terminal_ttl if purchase.status in TERMINAL_STATUSES else self.ttl
+        self._entries[purchase.id] = (purchase, time.monotonic() + ttl)
+        self._entries.move_to_end(purchase.id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
@@ -0,0 +1,39 @@
+"""Encode/decode throughput and bytes per message of the JSON and msgpack codecs.
+
+Usage: python codec_bench.py --messages 200000
+"""
+import argparse
+import time
+
+import codec
+
+SAMPLES = {
+    "purchase": {"purchase_id": 123456789, "user_id": 4242, "amount": 1999.99},
+    "status": {"purchase_id": 123456789, "status": "FINISHED"},
+}
+
+
+def rate(fn, messages):
+    started = time.perf_counter()
+    for _ in range(messages):
+        fn()
+    return messages / (time.perf_counter() - started)
+
+
+def main(args):
+    print(f"{'message':<10} {'codec':<8} {'bytes':>6} {'encode/s':>12} {'decode/s':>12}")
+    for kind, data in SAMPLES.items():
+        for content_type in (codec.JSON, codec.MSGPACK):
+            body = codec.encode(kind, data, content_type)
+            assert codec.decode(kind, body, content_type) == data
+
+            encode_rate = rate(lambda: codec.encode(kind, data, content_type), args.messages)
+            decode_rate = rate(lambda: codec.decode(kind, body, content_type), args.messages)
+            name = content_type.split("/")[1]
+            print(f"{kind:<10} {name:<8} {len(body):>6} {encode_rate:>12,.0f} {decode_rate:>12,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=200_000)
+    main(parser.parse_args())
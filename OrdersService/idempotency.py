@@ -0,0 +1,63 @@
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete
+from sqlalchemy.future import select
+
+import models
+import database
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyKeyMismatch(Exception):
+    pass
+
+
+class IdempotencyKeyInProgress(Exception):
+    pass
+
+
+def request_hash(payload) -> str:
+    body = json.dumps(payload.model_dump(mode="json"), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+async def stored_response(session, key: str, payload_hash: str) -> dict:
+    """Response saved by the request that first used this key.
+
+    Called after inserting the key hit the unique index, i.e. once that request has committed.
+    """
+    record = await session.execute(
+        select(models.IdempotencyKey).where(models.IdempotencyKey.key == key)
+    )
+    record = record.scalar_one_or_none()
+    if record is None or record.response is None:
+        raise IdempotencyKeyInProgress(f"Request with Idempotency-Key {key} is still in progress")
+    if record.request_hash != payload_hash:
+        raise IdempotencyKeyMismatch(f"Idempotency-Key {key} was already used with a different request")
+    return json.loads(record.response)
+
+
+async def delete_expired_keys(retention: float) -> int:
+    cutoff = datetime.utcnow() - timedelta(seconds=retention)
+    async with database.SessionLocal() as session:
+        result = await session.execute(
+            delete(models.IdempotencyKey).where(models.IdempotencyKey.created_at < cutoff)
+        )
+        await session.commit()
+    return result.rowcount
+
+
+async def purge_expired_keys(retention: float, interval: float):
+    while True:
+        try:
+            purged = await delete_expired_keys(retention)
+            if purged:
+                logger.info(f"Purged {purged} expired idempotency keys")
+        except Exception as e:
+            logger.error(f"Error purging idempotency keys: {e}")
+        await asyncio.sleep(interval)
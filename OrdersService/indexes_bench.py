@@ -0,0 +1,118 @@
+"""Query plans and latency of the purchase listing queries with and without the purchases indexes.
+
+Usage: python indexes_bench.py --rows 1000000 --repeat 50
+Requires PostgreSQL at DB_URL. Rows are seeded into a throwaway "purchases_bench" schema
+that is dropped at the end, so the service tables are left alone.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from sqlalchemy import MetaData, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import models
+from config import Settings
+
+settings = Settings()
+
+BENCH_SCHEMA = "purchases_bench"
+
+QUERIES = {
+    "user listing": (
+        f"SELECT * FROM {BENCH_SCHEMA}.purchases WHERE user_id = :user_id "
+        "ORDER BY created_at DESC, id DESC LIMIT 101"
+    ),
+    "user listing, next page": (
+        f"SELECT * FROM {BENCH_SCHEMA}.purchases WHERE user_id = :user_id "
+        "AND (created_at, id) < (now() - interval '30 days', 2147483647) "
+        "ORDER BY created_at DESC, id DESC LIMIT 101"
+    ),
+    "status + time range": (
+        f"SELECT * FROM {BENCH_SCHEMA}.purchases WHERE status = 'NEW' "
+        "AND created_at >= now() - interval '1 day' "
+        "ORDER BY created_at DESC, id DESC LIMIT 101"
+    ),
+}
+
+
+def bench_table():
+    metadata = MetaData()
+    return models.Purchase.__table__.to_metadata(metadata, schema=BENCH_SCHEMA)
+
+
+async def seed(conn, rows, users):
+    await conn.execute(text(f"""
+        INSERT INTO {BENCH_SCHEMA}.purchases (user_id, amount, description, status, created_at)
+        SELECT (random() * :users)::int,
+               round((random() * 1000)::numeric, 2),
+               'bench purchase ' || n,
+               (ARRAY['NEW', 'FINISHED', 'FINISHED', 'FINISHED', 'CANCELLED'])[1 + (random() * 4)::int]::orderstatus,
+               now() - random() * interval '365 days'
+        FROM generate_series(1, :rows) AS n
+    """), {"rows": rows, "users": users})
+    await conn.execute(text(f"ANALYZE {BENCH_SCHEMA}.purchases"))
+
+
+async def measure(conn, label, repeat, users):
+    print(f"\n=== {label}")
+    for name, sql in QUERIES.items():
+        params = {"user_id": random.randint(0, users)} if ":user_id" in sql else {}
+        plan = await conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {sql}"), params)
+        print(f"\n--- {name}")
+        for line in plan.scalars():
+            print(f"    {line}")
+
+        timings = []
+        for _ in range(repeat):
+            params = {"user_id": random.randint(0, users)} if ":user_id" in sql else {}
+            started = time.perf_counter()
+            await conn.execute(text(sql), params)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        print(f"    p50 {statistics.median(timings):.2f} ms   p99 {timings[int(len(timings) * 0.99) - 1]:.2f} ms")
+
+
+async def main(args):
+    engine = create_async_engine(settings.DB_URL)
+    table = bench_table()
+    indexes = list(table.indexes)
+
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {BENCH_SCHEMA}"))
+        await conn.run_sync(lambda sync_conn: table.create(sync_conn, checkfirst=True))
+        for index in indexes:
+            await conn.run_sync(lambda sync_conn: index.drop(sync_conn))
+
+    try:
+        print(f"Seeding {args.rows} purchases for {args.users} users...")
+        started = time.perf_counter()
+        async with engine.begin() as conn:
+            await seed(conn, args.rows, args.users)
+        print(f"Seeded in {time.perf_counter() - started:.1f} s")
+
+        async with engine.connect() as conn:
+            await measure(conn, "without indexes", args.repeat, args.users)
+
+        async with engine.begin() as conn:
+            for index in indexes:
+                await conn.run_sync(lambda sync_conn: index.create(sync_conn))
+            await conn.execute(text(f"ANALYZE {BENCH_SCHEMA}.purchases"))
+
+        async with engine.connect() as conn:
+            await measure(conn, "with indexes", args.repeat, args.users)
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
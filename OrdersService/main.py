@@ -1,34 +1,91 @@
 import logging
 import json
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request
 from sqlalchemy.orm import Session
 from sqlalchemy.future import select
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
 import asyncio
 import aio_pika
 import backoff
+from datetime import datetime
+from typing import Optional
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
 
+import codec
 import models
 import schemas
 import database
+import idempotency
+import pagination
+import status_updates
 from config import Settings
+from publisher import RabbitMQPublisher
+from outbox import OutboxRelay
+from cache import PurchaseCache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI()
 settings = Settings()
+publisher = RabbitMQPublisher(
+    settings.RABBITMQ_URL,
+    pool_size=settings.PUBLISHER_POOL_SIZE,
+    queues=(settings.PURCHASE_QUEUE,),
+    fanout_exchanges=(settings.PURCHASE_STATUS_EXCHANGE,)
+)
+outbox_relay = OutboxRelay(
+    publisher,
+    settings.PURCHASE_QUEUE,
+    batch_size=settings.OUTBOX_BATCH_SIZE,
+    poll_interval=settings.OUTBOX_POLL_INTERVAL,
+    content_type=settings.MESSAGE_CONTENT_TYPE
+)
+purchase_cache = PurchaseCache(
+    max_entries=settings.PURCHASE_CACHE_MAX_ENTRIES,
+    ttl=settings.PURCHASE_CACHE_TTL,
+    terminal_ttl=settings.PURCHASE_CACHE_TERMINAL_TTL
+)
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/cache/stats")
+async def cache_stats():
+    return purchase_cache.stats()
+
 @app.on_event("startup")
 async def startup():
     await database.init_db()
     loop = asyncio.get_event_loop()
     loop.create_task(consume(loop))
+    app.state.outbox_task = loop.create_task(run_outbox_relay())
+    loop.create_task(idempotency.purge_expired_keys(
+        settings.IDEMPOTENCY_KEY_RETENTION, settings.IDEMPOTENCY_PURGE_INTERVAL
+    ))
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.outbox_task.cancel()
+    await publisher.close()
+
+async def run_outbox_relay():
+    # The broker is only needed by the relay, so purchases are accepted while it is still unreachable.
+    # publisher.start() gives up after its backoff; keep retrying, as consume() does.
+    while True:
+        try:
+            await publisher.start()
+            break
+        except Exception as e:
+            logger.error(f"Error starting outbox publisher: {e}")
+            # Drop a connection opened before the failure, so retries don't leak it.
+            await publisher.close()
+            await asyncio.sleep(5)
+    await outbox_relay.run()
 
 @backoff.on_exception(backoff.expo, Exception, max_time=300)
 async def get_rabbitmq_connection(loop):
@@ -43,40 +100,50 @@ async def consume(loop):
         try:
             connection = await get_rabbitmq_connection(loop)
             channel = await get_rabbitmq_channel(connection)
+            await channel.set_qos(prefetch_count=settings.STATUS_PREFETCH_COUNT)
             
             queue = await channel.declare_queue(settings.PURCHASE_STATUS_QUEUE, durable=True)
             
-            async with queue.iterator() as queue_iter:
-                async for message in queue_iter:
-                    async with message.process():
-                        try:
-                            data = json.loads(message.body.decode())
-                            logger.info(f"Received status update: {data}")
-                            
-                            purchase_id = data["purchase_id"]
-                            status = data["status"]
-                            
-                            async with database.SessionLocal() as session:
-                                purchase = await session.execute(
-                                    select(models.Purchase).where(models.Purchase.id == purchase_id)
-                                )
-                                purchase = purchase.scalar_one_or_none()
-                                
-                                if not purchase:
-                                    logger.error(f"Purchase {purchase_id} not found")
-                                    continue
-                                    
-                                purchase.status = status
-                                await session.commit()
-                                logger.info(f"Updated status of purchase {purchase_id} to {status}")
-                                
-                        except Exception as e:
-                            logger.error(f"Error processing message: {e}")
+            pending = asyncio.Queue()
+            await queue.consume(pending.put)
+            
+            while True:
+                batch = await status_updates.collect_batch(
+                    pending, settings.STATUS_BATCH_SIZE, settings.STATUS_BATCH_TIMEOUT_MS / 1000
+                )
+                try:
+                    await status_updates.apply_status_batch(batch, purchase_cache, publish_status_changes)
+                except Exception as e:
+                    logger.error(f"Error applying status batch: {e}")
+                    await status_updates.requeue_batch(batch)
+                    await asyncio.sleep(1)
                             
         except Exception as e:
             logger.error(f"Error in consume: {e}")
             await asyncio.sleep(5)
 
+async def publish_status_changes(changes: dict):
+    """Fan committed status changes out to PURCHASE_STATUS_EXCHANGE for live subscribers (the gateway).
+
+    Best effort: the change is already stored and acked, so failures are only logged.
+    """
+    outcomes = await asyncio.gather(*(
+        publisher.publish(
+            codec.encode(
+                "status",
+                {"purchase_id": purchase_id, "status": status.value, "reason": reason},
+                settings.MESSAGE_CONTENT_TYPE
+            ),
+            "",
+            settings.MESSAGE_CONTENT_TYPE,
+            exchange=settings.PURCHASE_STATUS_EXCHANGE
+        )
+        for purchase_id, (status, reason) in changes.items()
+    ), return_exceptions=True)
+    failed = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+    if failed:
+        logger.warning(f"Could not publish {len(failed)} of {len(outcomes)} status changes: {failed[0]}")
+
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     logger.error(f"Validation error: {exc.errors()}")
@@ -86,11 +153,26 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     )
 
 @app.post("/purchases", response_model=schemas.Purchase)
-async def create_purchase(purchase: schemas.PurchaseCreate):
+async def create_purchase(
+    purchase: schemas.PurchaseCreate,
+    idempotency_key: Optional[str] = Header(None, max_length=255)
+):
     logger.info(f"Received purchase request: {purchase.model_dump()}")
     try:
         async with database.SessionLocal() as session:
             try:
+                if idempotency_key is not None:
+                    # A concurrent request with the same key blocks on the unique index until this one commits.
+                    payload_hash = idempotency.request_hash(purchase)
+                    key_record = models.IdempotencyKey(key=idempotency_key, request_hash=payload_hash)
+                    session.add(key_record)
+                    try:
+                        await session.flush()
+                    except IntegrityError:
+                        await session.rollback()
+                        logger.info(f"Replaying stored response for Idempotency-Key {idempotency_key}")
+                        return await idempotency.stored_response(session, idempotency_key, payload_hash)
+
                 db_purchase = models.Purchase(
                     user_id=purchase.user_id,
                     amount=purchase.amount,
@@ -98,47 +180,100 @@ async def create_purchase(purchase: schemas.PurchaseCreate):
                     status=schemas.OrderStatus.NEW
                 )
                 session.add(db_purchase)
+                await session.flush()
+                
+                session.add(models.PurchaseOutbox(
+                    purchase_id=db_purchase.id,
+                    user_id=db_purchase.user_id,
+                    amount=db_purchase.amount
+                ))
+
+                if idempotency_key is not None:
+                    await session.refresh(db_purchase)
+                    key_record.purchase_id = db_purchase.id
+                    key_record.response = schemas.Purchase.model_validate(db_purchase).model_dump_json()
+
                 await session.commit()
                 await session.refresh(db_purchase)
                 
-                try:
-                    connection = await get_rabbitmq_connection(asyncio.get_event_loop())
-                    channel = await get_rabbitmq_channel(connection)
-                    
-                    queue = await channel.declare_queue(settings.PURCHASE_QUEUE, durable=True)
-                    
-                    message = {
-                        "purchase_id": db_purchase.id,
-                        "user_id": db_purchase.user_id,
-                        "amount": float(db_purchase.amount)
-                    }
-                    
-                    await channel.default_exchange.publish(
-                        aio_pika.Message(body=json.dumps(message).encode(), delivery_mode=aio_pika.DeliveryMode.PERSISTENT),
-                        routing_key=queue.name
-                    )
-                    
-                    logger.info(f"Sent purchase {db_purchase.id} to processing")
-                    await connection.close()
-                    
-                except Exception as e:
-                    logger.error(f"Error sending purchase to processing: {e}")
-                    db_purchase.status = schemas.OrderStatus.CANCELLED
-                    await session.commit()
-                    raise HTTPException(status_code=500, detail=str(e))
+                outbox_relay.notify()
+                logger.info(f"Queued purchase {db_purchase.id} for processing")
                     
                 return db_purchase
                 
+            except idempotency.IdempotencyKeyMismatch as e:
+                raise HTTPException(status_code=422, detail=str(e))
+            except idempotency.IdempotencyKeyInProgress as e:
+                raise HTTPException(status_code=409, detail=str(e))
+            except HTTPException:
+                raise
             except Exception as e:
                 logger.error(f"Database error creating purchase: {e}")
                 raise HTTPException(status_code=500, detail=str(e))
                 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error creating purchase: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/purchases/batch", response_model=schemas.PurchaseBatchResult)
+async def create_purchases_batch(batch: schemas.PurchaseBatchCreate):
+    if len(batch.purchases) > settings.PURCHASE_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch is limited to {settings.PURCHASE_BATCH_MAX_ITEMS} purchases"
+        )
+
+    results = [None] * len(batch.purchases)
+    valid = []
+    for index, item in enumerate(batch.purchases):
+        try:
+            valid.append((index, schemas.PurchaseCreate.model_validate(item)))
+        except ValidationError as e:
+            results[index] = schemas.PurchaseBatchItemResult(
+                index=index, status="rejected", errors=e.errors(include_url=False, include_context=False)
+            )
+
+    if valid:
+        try:
+            async with database.SessionLocal() as session:
+                created = await session.scalars(
+                    insert(models.Purchase).returning(models.Purchase, sort_by_parameter_order=True),
+                    [{**purchase.model_dump(), "status": schemas.OrderStatus.NEW} for _, purchase in valid]
+                )
+                created = created.all()
+                await session.execute(
+                    insert(models.PurchaseOutbox),
+                    [
+                        {"purchase_id": purchase.id, "user_id": purchase.user_id, "amount": purchase.amount}
+                        for purchase in created
+                    ]
+                )
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Database error creating purchase batch: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+        outbox_relay.notify()
+        logger.info(f"Queued {len(created)} purchases for processing")
+
+        for (index, _), purchase in zip(valid, created):
+            results[index] = schemas.PurchaseBatchItemResult(index=index, status="created", purchase=purchase)
+
+    return schemas.PurchaseBatchResult(
+        created=len(valid),
+        rejected=len(batch.purchases) - len(valid),
+        results=results
+    )
+
 @app.get("/purchases/{purchase_id}", response_model=schemas.Purchase)
 async def get_purchase(purchase_id: int):
+    cached = purchase_cache.get(purchase_id)
+    if cached is not None:
+        return cached
+
+    generation = purchase_cache.generation()
     async with database.SessionLocal() as session:
         purchase = await session.execute(
             select(models.Purchase).where(models.Purchase.id == purchase_id)
@@ -146,10 +281,43 @@ async def get_purchase(purchase_id: int):
         purchase = purchase.scalar_one_or_none()
         if not purchase:
             raise HTTPException(status_code=404, detail="Purchase not found")
+        purchase = schemas.Purchase.model_validate(purchase)
+        purchase_cache.put(purchase, generation)
         return purchase
 
-@app.get("/purchases", response_model=list[schemas.Purchase])
-async def get_purchases():
+@app.get("/purchases", response_model=schemas.PurchaseList)
+async def get_purchases(
+    limit: int = Query(settings.PURCHASES_PAGE_SIZE, ge=1, le=settings.PURCHASES_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user_id: Optional[int] = None,
+    status: Optional[schemas.OrderStatus] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None
+):
+    query = select(models.Purchase)
+    if user_id is not None:
+        query = query.where(models.Purchase.user_id == user_id)
+    if status is not None:
+        query = query.where(models.Purchase.status == status)
+    if created_from is not None:
+        query = query.where(models.Purchase.created_at >= created_from)
+    if created_to is not None:
+        query = query.where(models.Purchase.created_at < created_to)
+
+    try:
+        query = pagination.paginate_purchases(query, limit, cursor)
+    except pagination.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     async with database.SessionLocal() as session:
-        purchases = await session.execute(select(models.Purchase))
-        return purchases.scalars().all() 
\ No newline at end of file
+        purchases = await session.execute(query)
+        return pagination.page_of(purchases.scalars().all(), limit) 
+
+@app.get("/users/{user_id}/purchases", response_model=schemas.PurchaseList)
+async def get_user_purchases(
+    user_id: int,
+    limit: int = Query(settings.PURCHASES_PAGE_SIZE, ge=1, le=settings.PURCHASES_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[schemas.OrderStatus] = None
+):
+    return await get_purchases(limit=limit, cursor=cursor, user_id=user_id, status=status)
\ No newline at end of file
@@ -0,0 +1,50 @@
+"""Purchase listing indexes, unsent outbox index and idempotency keys
+
+Revision ID: 0002_indexes_idempotency
+Revises: 0001_baseline
+Create Date: 2026-10-18 09:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002_indexes_idempotency"
+down_revision: Union[str, Sequence[str], None] = "0001_baseline"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index("ix_purchases_user_id_created_at", "purchases", ["user_id", "created_at", "id"])
+    op.create_index("ix_purchases_status_created_at", "purchases", ["status", "created_at", "id"])
+    op.create_index(
+        "ix_purchase_outbox_unsent",
+        "purchase_outbox",
+        ["id"],
+        postgresql_where=sa.text("NOT is_sent"),
+        sqlite_where=sa.text("NOT is_sent"),
+    )
+    op.create_table(
+        "idempotency_keys",
+        sa.Column("key", sa.String(length=255), nullable=False),
+        sa.Column("request_hash", sa.String(length=64), nullable=False),
+        sa.Column("purchase_id", sa.Integer(), nullable=True),
+        sa.Column("response", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint("key"),
+    )
+    op.create_index("ix_idempotency_keys_created_at", "idempotency_keys", ["created_at"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_idempotency_keys_created_at", table_name="idempotency_keys")
+    op.drop_table("idempotency_keys")
+    op.drop_index("ix_purchase_outbox_unsent", table_name="purchase_outbox")
+    op.drop_index("ix_purchases_status_created_at", table_name="purchases")
+    op.drop_index("ix_purchases_user_id_created_at", table_name="purchases")
@@ -0,0 +1,28 @@
+"""Reason code for the purchase status
+
+Revision ID: 0003_purchase_status_reason
+Revises: 0002_indexes_idempotency
+Create Date: 2026-10-18 16:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003_purchase_status_reason"
+down_revision: Union[str, Sequence[str], None] = "0002_indexes_idempotency"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("purchases", sa.Column("status_reason", sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("purchases", "status_reason")
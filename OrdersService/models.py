@@ -1,24 +1,52 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, func, Boolean, Enum as SQLAlchemyEnum
+from sqlalchemy import Column, Integer, String, Float, DateTime, func, Boolean, Index, Text, text, Enum as SQLAlchemyEnum
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.orm import declarative_base
 from schemas import OrderStatus
 
 Base = declarative_base()
 
+# SQLite keeps func.now() as "YYYY-MM-DD HH:MM:SS" text and compares it as text, so bound
+# datetimes must be written the same way; the default format appends ".000000", which sorts
+# after every row of the same second and breaks keyset pagination and range filters.
+Timestamp = DateTime().with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite",
+)
+
 class Purchase(Base):
     __tablename__ = "purchases"
+    # The trailing id matches the (created_at, id) keyset order used by the list endpoints.
+    __table_args__ = (
+        Index("ix_purchases_user_id_created_at", "user_id", "created_at", "id"),
+        Index("ix_purchases_status_created_at", "status", "created_at", "id"),
+    )
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, nullable=False)
     amount = Column(Float, nullable=False)
     description = Column(String, nullable=False)
     status = Column(SQLAlchemyEnum(OrderStatus), nullable=False)
-    created_at = Column(DateTime, server_default=func.now())
+    # Reason code sent by PaymentsService with a CANCELLED status, e.g. INSUFFICIENT_FUNDS.
+    status_reason = Column(String, nullable=True)
+    created_at = Column(Timestamp, server_default=func.now())
 
 
 class PurchaseOutbox(Base):
     __tablename__ = "purchase_outbox"
+    __table_args__ = (
+        Index("ix_purchase_outbox_unsent", "id", postgresql_where=text("NOT is_sent"), sqlite_where=text("NOT is_sent")),
+    )
     id = Column(Integer, primary_key=True)
     purchase_id = Column(Integer, nullable=False, unique=True)
     user_id = Column(Integer, nullable=False)
     amount = Column(Float, nullable=False)
     is_sent = Column(Boolean, default=False, nullable=False)
-    created_at = Column(DateTime, server_default=func.now()) 
\ No newline at end of file
+    created_at = Column(Timestamp, server_default=func.now())
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    key = Column(String(255), primary_key=True)
+    request_hash = Column(String(64), nullable=False)
+    purchase_id = Column(Integer, nullable=True)
+    response = Column(Text, nullable=True)
+    created_at = Column(Timestamp, server_default=func.now(), index=True)
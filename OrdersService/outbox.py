@@ -0,0 +1,91 @@
+import asyncio
+import logging
+
+from sqlalchemy import update
+from sqlalchemy.future import select
+
+import codec
+import models
+import database
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxRelay:
+    """Drains unsent PurchaseOutbox rows in batches and publishes them to the purchase queue."""
+
+    def __init__(
+        self,
+        publisher,
+        routing_key: str,
+        batch_size: int = 100,
+        poll_interval: float = 1.0,
+        content_type: str = codec.JSON
+    ):
+        self.publisher = publisher
+        self.routing_key = routing_key
+        self.content_type = content_type
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+
+    def notify(self):
+        self._wakeup.set()
+
+    async def run(self):
+        while True:
+            # Cleared before draining, so a notify() for a row committed during the drain wakes the wait below.
+            self._wakeup.clear()
+            try:
+                sent = await self.relay_batch()
+                if sent == self.batch_size:
+                    continue
+            except Exception as e:
+                logger.error(f"Error in outbox relay: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def relay_batch(self) -> int:
+        async with database.SessionLocal() as session:
+            result = await session.execute(
+                select(models.PurchaseOutbox)
+                .where(models.PurchaseOutbox.is_sent.is_(False))
+                .order_by(models.PurchaseOutbox.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            rows = result.scalars().all()
+            if not rows:
+                return 0
+
+            outcomes = await asyncio.gather(
+                *(self._publish(row) for row in rows), return_exceptions=True
+            )
+            sent_ids = [row.id for row, outcome in zip(rows, outcomes) if outcome is None]
+            for row, outcome in zip(rows, outcomes):
+                if outcome is not None:
+                    logger.error(f"Error sending purchase {row.purchase_id} to processing: {outcome}")
+
+            if sent_ids:
+                await session.execute(
+                    update(models.PurchaseOutbox)
+                    .where(models.PurchaseOutbox.id.in_(sent_ids))
+                    .values(is_sent=True)
+                )
+            await session.commit()
+
+            logger.info(f"Relayed {len(sent_ids)} of {len(rows)} outbox messages")
+            return len(sent_ids)
+
+    async def _publish(self, row):
+        message = {
+            "purchase_id": row.purchase_id,
+            "user_id": row.user_id,
+            "amount": float(row.amount)
+        }
+        await self.publisher.publish(
+            codec.encode("purchase", message, self.content_type), self.routing_key, self.content_type
+        )
@@ -0,0 +1,44 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import literal, tuple_
+
+import models
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(purchase) -> str:
+    raw = json.dumps([purchase.created_at.isoformat(), purchase.id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, purchase_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(purchase_id)
+    except Exception as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+
+def paginate_purchases(query, limit: int, cursor: str = None):
+    """Order newest first on (created_at, id) and continue strictly after the cursor.
+
+    One extra row is fetched so the caller can tell whether another page exists.
+    """
+    if cursor:
+        created_at, purchase_id = decode_cursor(cursor)
+        query = query.where(
+            tuple_(models.Purchase.created_at, models.Purchase.id)
+            < tuple_(literal(created_at, models.Purchase.created_at.type), purchase_id)
+        )
+    return query.order_by(models.Purchase.created_at.desc(), models.Purchase.id.desc()).limit(limit + 1)
+
+
+def page_of(rows: list, limit: int) -> dict:
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {"purchases": rows[:limit], "next_cursor": next_cursor}
@@ -0,0 +1,75 @@
+"""Compare per-request broker publishing with the pooled RabbitMQPublisher.
+
+Usage: python publisher_bench.py --messages 2000 --concurrency 50
+Requires a running RabbitMQ at RABBITMQ_URL.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import aio_pika
+
+from config import Settings
+from publisher import RabbitMQPublisher
+
+settings = Settings()
+
+BENCH_QUEUE = "publisher_bench_queue"
+
+
+async def publish_per_request(body):
+    # Mirrors the old create_purchase path: connect, open channel, declare, publish, close.
+    connection = await aio_pika.connect_robust(settings.RABBITMQ_URL)
+    channel = await connection.channel()
+    queue = await channel.declare_queue(BENCH_QUEUE, durable=True)
+    await channel.default_exchange.publish(
+        aio_pika.Message(body=body, delivery_mode=aio_pika.DeliveryMode.PERSISTENT),
+        routing_key=queue.name
+    )
+    await connection.close()
+
+
+async def run(name, publish, messages, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        body = json.dumps({"purchase_id": i, "user_id": i % 100, "amount": 10.0}).encode()
+        async with semaphore:
+            started = time.perf_counter()
+            await publish(body)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(messages)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{name:<12} {messages / elapsed:>10.0f} msg/s   p50 {p50:>8.2f} ms   p99 {p99:>8.2f} ms")
+
+
+async def main(args):
+    print(f"{args.messages} messages, concurrency {args.concurrency}")
+
+    await run("per-request", publish_per_request, args.messages, args.concurrency)
+
+    publisher = RabbitMQPublisher(settings.RABBITMQ_URL, pool_size=args.pool_size, queues=(BENCH_QUEUE,))
+    await publisher.start()
+    try:
+        await run("pooled", lambda body: publisher.publish(body, BENCH_QUEUE), args.messages, args.concurrency)
+    finally:
+        async with publisher.channel_pool.acquire() as channel:
+            await channel.queue_delete(BENCH_QUEUE)
+        await publisher.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--pool-size", type=int, default=settings.PUBLISHER_POOL_SIZE)
+    asyncio.run(main(parser.parse_args()))
@@ -1,6 +1,7 @@
 from pydantic import BaseModel
 from datetime import datetime
 from enum import Enum
+from typing import Any, Optional
 
 class OrderStatus(str, Enum):
     NEW = "NEW"
@@ -18,6 +19,7 @@ class PurchaseCreate(PurchaseBase):
 class Purchase(PurchaseBase):
     id: int
     status: OrderStatus
+    status_reason: Optional[str] = None
     created_at: datetime
 
     class Config:
@@ -25,6 +27,22 @@ class Purchase(PurchaseBase):
 
 class PurchaseList(BaseModel):
     purchases: list[Purchase]
+    next_cursor: Optional[str] = None
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True 
+
+class PurchaseBatchCreate(BaseModel):
+    # Items are validated one by one so a bad item is reported instead of failing the batch.
+    purchases: list[Any]
+
+class PurchaseBatchItemResult(BaseModel):
+    index: int
+    status: str
+    purchase: Optional[Purchase] = None
+    errors: Optional[list[Any]] = None
+
+class PurchaseBatchResult(BaseModel):
+    created: int
+    rejected: int
+    results: list[PurchaseBatchItemResult]
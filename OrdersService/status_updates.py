@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import time
+
+from sqlalchemy import case, cast, update
+
+import codec
+import models
+import schemas
+import database
+
+logger = logging.getLogger(__name__)
+
+
+async def collect_batch(pending: asyncio.Queue, max_size: int, max_wait: float) -> list:
+    """Wait for one message, then gather more until max_size messages or max_wait seconds."""
+    batch = [await pending.get()]
+    deadline = time.monotonic() + max_wait
+
+    while len(batch) < max_size:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(await asyncio.wait_for(pending.get(), timeout=remaining))
+        except asyncio.TimeoutError:
+            break
+
+    return batch
+
+
+def decode_status_update(message):
+    data = codec.decode("status", message.body, message.content_type)
+    return int(data["purchase_id"]), schemas.OrderStatus(data["status"]), data.get("reason")
+
+
+async def apply_status_batch(messages: list, cache=None, notify=None):
+    """Apply a batch of status messages with one UPDATE and ack them all.
+
+    The last update per purchase wins, together with its reason code; a message
+    without a reason leaves the stored one as it is. Malformed
+    messages and messages for unknown purchases are logged and acked on their own so
+    they never hold the batch back.
+    Cached purchases are updated once the transaction has committed. notify, if
+    given, is then awaited with {purchase_id: (status, reason)} of the updated purchases.
+    """
+    statuses = {}
+    reasons = {}
+    by_purchase = {}
+    for message in messages:
+        try:
+            purchase_id, status, reason = decode_status_update(message)
+        except Exception as e:
+            logger.error(f"Error processing message: {e}")
+            await message.ack()
+            continue
+        statuses[purchase_id] = status
+        reasons[purchase_id] = reason
+        by_purchase.setdefault(purchase_id, []).append(message)
+
+    if not statuses:
+        return
+
+    values = {
+        "status": cast(
+            case({pid: status.value for pid, status in statuses.items()}, value=models.Purchase.id),
+            models.Purchase.status.type
+        )
+    }
+    with_reason = {pid: reason for pid, reason in reasons.items() if reason is not None}
+    if with_reason:
+        # Purchases whose message carries no reason keep the one they have.
+        values["status_reason"] = case(with_reason, value=models.Purchase.id, else_=models.Purchase.status_reason)
+
+    async with database.SessionLocal() as session:
+        result = await session.execute(
+            update(models.Purchase)
+            .where(models.Purchase.id.in_(statuses))
+            .values(values)
+            .returning(models.Purchase.id)
+        )
+        updated = set(result.scalars().all())
+        await session.commit()
+
+    if cache is not None:
+        for purchase_id in updated:
+            cache.set_status(purchase_id, statuses[purchase_id], reasons[purchase_id])
+
+    acked = []
+    for purchase_id, purchase_messages in by_purchase.items():
+        if purchase_id in updated:
+            acked.extend(purchase_messages)
+            continue
+        logger.error(f"Purchase {purchase_id} not found")
+        for message in purchase_messages:
+            await message.ack()
+
+    if acked:
+        last = max(acked, key=lambda message: message.delivery_tag)
+        await last.ack(multiple=True)
+
+    logger.info(f"Updated status of {len(updated)} purchases from {len(messages)} messages")
+
+    if notify is not None and updated:
+        await notify({purchase_id: (statuses[purchase_id], reasons[purchase_id]) for purchase_id in updated})
+
+
+async def requeue_batch(messages: list):
+    for message in messages:
+        if message.processed:
+            continue
+        try:
+            await message.nack(requeue=True)
+        except Exception as e:
+            logger.error(f"Error requeueing message: {e}")
@@ -0,0 +1,60 @@
+"""Request bodies of the bulk wallet endpoints: a JSON object holding a list, or NDJSON.
+
+NDJSON bodies are parsed while they stream in, so a large upload is never held as one
+document. A line that is not valid JSON is passed on as its raw text and gets rejected
+by item validation like any other bad item.
+"""
+import json
+
+from fastapi import HTTPException, Request
+
+NDJSON = "application/x-ndjson"
+
+
+def is_ndjson(request: Request) -> bool:
+    return request.headers.get("content-type", "").split(";")[0].strip() == NDJSON
+
+
+def parse_line(line: bytes):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return line.decode(errors="replace")
+
+
+async def read_items(request: Request, key: str):
+    if is_ndjson(request):
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield parse_line(line)
+        if buffer.strip():
+            yield parse_line(buffer)
+        return
+
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body is not valid JSON")
+    items = body.get(key) if isinstance(body, dict) else None
+    if not isinstance(items, list):
+        raise HTTPException(status_code=422, detail=f"Expected a JSON object with a '{key}' list")
+    for item in items:
+        yield item
+
+
+async def chunks(items, size: int):
+    """Group an async iterator of items into lists of (index, item) of at most size."""
+    chunk = []
+    index = 0
+    async for item in items:
+        chunk.append((index, item))
+        index += 1
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
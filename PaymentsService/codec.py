@@ -0,0 +1,60 @@
+"""Message codecs for purchase_queue, purchase_status_queue and purchase_status_exchange.
+
+The sender picks the encoding and records it in the AMQP content-type header; the
+receiver decodes by that header. Messages without a content type (older senders)
+are read as JSON, so mixed-version deployments keep working. Decimal and datetime
+values are sent as strings (str() and isoformat()) so no precision is lost; the
+receiver parses the fields it expects.
+
+Keep this module identical in OrdersService, PaymentsService and ApiGateway.
+"""
+import json
+from datetime import datetime
+from decimal import Decimal
+
+import msgpack
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+
+# Field order of the compact positional encoding. New fields go at the end; decoders
+# fill fields missing from older senders with None.
+FIELDS = {
+    "purchase": ("purchase_id", "user_id", "amount"),
+    "status": ("purchase_id", "status", "reason"),
+}
+
+STATUS_CODES = {"NEW": 0, "FINISHED": 1, "CANCELLED": 2}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+
+def _encode_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__} in a message")
+
+
+def encode(kind: str, data: dict, content_type: str = JSON) -> bytes:
+    if content_type == MSGPACK:
+        values = [data.get(field) for field in FIELDS[kind]]
+        if kind == "status":
+            values[1] = STATUS_CODES[values[1]]
+        return msgpack.packb(values, default=_encode_value)
+    if content_type == JSON:
+        return json.dumps(data, default=_encode_value).encode()
+    raise ValueError(f"Unsupported content type: {content_type}")
+
+
+def decode(kind: str, body: bytes, content_type: str = None) -> dict:
+    if content_type == MSGPACK:
+        values = msgpack.unpackb(body)
+        fields = FIELDS[kind]
+        data = dict(zip(fields, values + [None] * (len(fields) - len(values))))
+        if kind == "status":
+            data["status"] = STATUS_NAMES[data["status"]]
+        return data
+    if content_type in (None, "", JSON):
+        return json.loads(body.decode())
+    raise ValueError(f"Unsupported content type: {content_type}")
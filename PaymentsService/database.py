@@ -1,16 +1,88 @@
+import logging
+import os
+import time
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy import inspect, text
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
 import models
 from config import settings
+from pool_metrics import InstrumentedPool
 
-engine = create_async_engine(
-    settings.DB_URL,
-    pool_size=1, 
-    max_overflow=0
-)
+logger = logging.getLogger(__name__)
+
+def engine_options() -> dict:
+    # SQLite (tests, local runs) keeps SQLAlchemy's default pool for its driver.
+    if settings.DB_URL.startswith("sqlite"):
+        return {}
+    return {
+        "poolclass": InstrumentedPool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "connect_args": {"prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE},
+    }
+
+engine = create_async_engine(settings.DB_URL, **engine_options())
 SessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+# Schema created by the old drop_all/create_all startup, adopted without re-running its DDL.
+BASELINE_REVISION = "0001_baseline"
+# pg_advisory_lock key, so that only one replica runs migrations at a time.
+MIGRATION_LOCK_ID = 4_202_002
+
+def alembic_config(connection=None) -> Config:
+    config = Config(ALEMBIC_INI)
+    if connection is not None:
+        config.attributes["connection"] = connection
+    return config
+
+def current_revisions(connection, config: Config) -> set:
+    context = MigrationContext.configure(
+        connection, opts={"version_table": config.get_main_option("version_table")}
+    )
+    return set(context.get_current_heads())
+
+def run_migrations(connection):
+    config = alembic_config(connection)
+    if not current_revisions(connection, config) and inspect(connection).has_table(models.Wallet.__tablename__):
+        logger.info(f"Stamping existing schema as {BASELINE_REVISION}")
+        command.stamp(config, BASELINE_REVISION)
+    command.upgrade(config, "head")
+
 async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(models.Base.metadata.drop_all)
-        await conn.run_sync(models.Base.metadata.create_all)
\ No newline at end of file
+    """Bring the schema to the latest migration, or fail if migrations are disabled.
+
+    Warm replicas only compare the stored revision with the migration head.
+    """
+    started = time.perf_counter()
+    config = alembic_config()
+    heads = set(ScriptDirectory.from_config(config).get_heads())
+
+    async with engine.connect() as conn:
+        current = await conn.run_sync(current_revisions, config)
+        if current != heads:
+            if not settings.DB_AUTO_MIGRATE:
+                raise RuntimeError(f"Database schema is at {current or 'no revision'}, expected {heads}")
+
+            use_lock = conn.dialect.name == "postgresql"
+            if use_lock:
+                await conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+            try:
+                await conn.run_sync(run_migrations)
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+            finally:
+                if use_lock:
+                    await conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+                    await conn.commit()
+
+    logger.info(f"Database schema ready in {time.perf_counter() - started:.3f}s")
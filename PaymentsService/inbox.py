@@ -0,0 +1,36 @@
+from sqlalchemy.dialects import postgresql, sqlite
+
+import models
+
+
+def insert_new(session, rows: list):
+    dialect = postgresql if session.bind.dialect.name == "postgresql" else sqlite
+    return (
+        dialect.insert(models.PurchaseInbox)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=[models.PurchaseInbox.purchase_id])
+        .returning(models.PurchaseInbox.purchase_id)
+    )
+
+
+async def record_purchase(session, purchase_id: int, user_id: int, amount: float) -> bool:
+    """Insert the purchase into the inbox unless it is already there.
+
+    Returns False for a redelivered purchase. The unique index on purchase_id makes
+    this one indexed write; call it in the same transaction as the debit so that the
+    inbox row and the debit commit or roll back together.
+    """
+    result = await session.execute(
+        insert_new(session, [{"purchase_id": purchase_id, "user_id": user_id, "amount": amount}])
+    )
+    return result.scalar_one_or_none() is not None
+
+
+async def record_purchases(session, purchases: list) -> set:
+    """Multi-row record_purchase; returns the purchase_ids that were not in the inbox yet."""
+    rows = [
+        {"purchase_id": data["purchase_id"], "user_id": data["user_id"], "amount": data["amount"]}
+        for data in purchases
+    ]
+    result = await session.execute(insert_new(session, rows))
+    return set(result.scalars().all())
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import and_, case, func, insert, select, update
+
+import models
+import database
+
+logger = logging.getLogger(__name__)
+
+signed_amount = case(
+    (models.Transaction.type == models.TransactionType.DEPOSIT, models.Transaction.amount),
+    else_=-models.Transaction.amount,
+)
+
+
+def latest_snapshots():
+    """Newest snapshot per wallet, as a subquery with user_id, balance and last_transaction_id."""
+    newest = (
+        select(
+            models.WalletSnapshot.user_id,
+            func.max(models.WalletSnapshot.last_transaction_id).label("last_transaction_id"),
+        )
+        .group_by(models.WalletSnapshot.user_id)
+        .subquery()
+    )
+    return (
+        select(
+            models.WalletSnapshot.user_id,
+            models.WalletSnapshot.balance,
+            models.WalletSnapshot.last_transaction_id,
+        )
+        .join(
+            newest,
+            and_(
+                models.WalletSnapshot.user_id == newest.c.user_id,
+                models.WalletSnapshot.last_transaction_id == newest.c.last_transaction_id,
+            ),
+        )
+        .subquery()
+    )
+
+
+async def take_snapshots(session, lag: float) -> int:
+    """Snapshot every wallet that has ledger entries newer than its latest snapshot.
+
+    Only entries older than lag seconds are folded in: ids are assigned before commit,
+    so a recent id may still belong to a transaction that commits after this one.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=lag)
+    upto = await session.scalar(
+        select(func.max(models.Transaction.id)).where(models.Transaction.created_at < cutoff)
+    )
+    if upto is None:
+        return 0
+
+    snapshot = latest_snapshots()
+    since = func.coalesce(snapshot.c.last_transaction_id, 0)
+    result = await session.execute(
+        insert(models.WalletSnapshot).from_select(
+            ["user_id", "balance", "last_transaction_id"],
+            select(
+                models.Transaction.user_id,
+                func.coalesce(func.max(snapshot.c.balance), 0) + func.sum(signed_amount),
+                func.max(models.Transaction.id),
+            )
+            .select_from(models.Transaction)
+            .outerjoin(snapshot, snapshot.c.user_id == models.Transaction.user_id)
+            .where(models.Transaction.id > since, models.Transaction.id <= upto)
+            .group_by(models.Transaction.user_id),
+        )
+    )
+    return result.rowcount
+
+
+async def ledger_balance(session, user_id: int) -> Decimal:
+    """Balance from the latest snapshot plus the ledger entries recorded after it."""
+    snapshot = await session.execute(
+        select(models.WalletSnapshot.balance, models.WalletSnapshot.last_transaction_id)
+        .where(models.WalletSnapshot.user_id == user_id)
+        .order_by(models.WalletSnapshot.last_transaction_id.desc())
+        .limit(1)
+    )
+    balance, since = snapshot.one_or_none() or (Decimal(0), 0)
+    recent = await session.scalar(
+        select(func.coalesce(func.sum(signed_amount), 0))
+        .where(models.Transaction.user_id == user_id, models.Transaction.id > since)
+    )
+    return Decimal(balance) + Decimal(recent)
+
+
+async def rebuild_wallet(session, user_id: int):
+    """Overwrite the cached Wallet.money with the ledger balance; returns the Wallet or None."""
+    wallet = await session.scalar(
+        select(models.Wallet).where(models.Wallet.user_id == user_id).with_for_update()
+    )
+    if wallet is None:
+        return None
+
+    balance = await ledger_balance(session, user_id)
+    if wallet.money != balance:
+        logger.warning(f"Wallet of user {user_id} was {wallet.money}, ledger says {balance}")
+        await session.execute(
+            update(models.Wallet).where(models.Wallet.user_id == user_id).values(money=balance)
+        )
+        wallet.money = balance
+    return wallet
+
+
+async def history(session, user_id: int, limit: int, cursor: int = None) -> dict:
+    """Newest-first page of a wallet's ledger, keyset-paginated on (user_id, id)."""
+    query = select(models.Transaction).where(models.Transaction.user_id == user_id)
+    if cursor is not None:
+        query = query.where(models.Transaction.id < cursor)
+    result = await session.execute(query.order_by(models.Transaction.id.desc()).limit(limit + 1))
+    rows = result.scalars().all()
+    return {
+        "transactions": rows[:limit],
+        "next_cursor": rows[limit - 1].id if len(rows) > limit else None,
+    }
+
+
+async def snapshot_periodically(interval: float, lag: float):
+    while True:
+        try:
+            async with database.SessionLocal() as session:
+                created = await take_snapshots(session, lag)
+                await session.commit()
+            if created:
+                logger.info(f"Took {created} wallet snapshots")
+        except Exception as e:
+            logger.error(f"Error taking wallet snapshots: {e}")
+        await asyncio.sleep(interval)
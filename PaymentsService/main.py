@@ -1,6 +1,9 @@
 import logging
 import json
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from sqlalchemy.future import select
 from sqlalchemy import and_
@@ -10,27 +13,77 @@ import backoff
 from datetime import datetime
 from typing import List, Optional
 
+import bulk
+import codec
 import models
 import schemas
 import database
+import inbox
+import ledger
+import pool_metrics
+import reconciliation
+import wallets
+import workers
 from config import Settings
+from publisher import RabbitMQPublisher
+from outbox import OutboxRelay
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI()
 settings = Settings()
+publisher = RabbitMQPublisher(
+    settings.RABBITMQ_URL,
+    pool_size=settings.PUBLISHER_POOL_SIZE,
+    queues=(settings.PURCHASE_STATUS_QUEUE,)
+)
+WALLET_BATCH_ITEMS = TypeAdapter(List[schemas.WalletCreate])
+DEPOSIT_BATCH_ITEMS = TypeAdapter(List[schemas.WalletDeposit])
+outbox_relay = OutboxRelay(
+    publisher,
+    settings.PURCHASE_STATUS_QUEUE,
+    batch_size=settings.OUTBOX_BATCH_SIZE,
+    poll_interval=settings.OUTBOX_POLL_INTERVAL,
+    content_type=settings.MESSAGE_CONTENT_TYPE
+)
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/db/pool/stats")
+async def db_pool_stats():
+    return pool_metrics.metrics.stats(database.engine.pool)
+
 @app.on_event("startup")
 async def startup():
     await database.init_db()
     loop = asyncio.get_event_loop()
     loop.create_task(consume(loop))
-    loop.create_task(process_outbox(loop))
+    app.state.outbox_task = loop.create_task(run_outbox_relay())
+    loop.create_task(ledger.snapshot_periodically(
+        settings.LEDGER_SNAPSHOT_INTERVAL, settings.LEDGER_SNAPSHOT_LAG
+    ))
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.outbox_task.cancel()
+    await publisher.close()
+
+async def run_outbox_relay():
+    # Payments keep being debited while the broker is unreachable; statuses wait in the outbox.
+    # publisher.start() gives up after its backoff; keep retrying, as consume() does.
+    while True:
+        try:
+            await publisher.start()
+            break
+        except Exception as e:
+            logger.error(f"Error starting outbox publisher: {e}")
+            # Drop a connection opened before the failure, so retries don't leak it.
+            await publisher.close()
+            await asyncio.sleep(5)
+    await outbox_relay.run()
 
 @backoff.on_exception(backoff.expo, Exception, max_time=300)
 async def get_rabbitmq_connection(loop):
@@ -45,78 +98,216 @@ async def consume(loop):
         try:
             connection = await get_rabbitmq_connection(loop)
             channel = await get_rabbitmq_channel(connection)
+            await channel.set_qos(
+                prefetch_count=settings.PAYMENT_WORKERS * settings.PAYMENT_PREFETCH_PER_WORKER
+            )
             
             queue = await channel.declare_queue(settings.PURCHASE_QUEUE, durable=True)
             
-            async with queue.iterator() as queue_iter:
-                async for message in queue_iter:
-                    async with message.process():
+            pool = workers.PaymentWorkerPool(
+                settings.PAYMENT_WORKERS,
+                process_payment,
+                batch_handler=process_payment_batch,
+                max_batch=settings.HOT_WALLET_BATCH_SIZE,
+                max_wait=settings.HOT_WALLET_BATCH_WINDOW_MS / 1000,
+                max_attempts=settings.PAYMENT_MAX_ATTEMPTS,
+                retry_delay=settings.PAYMENT_RETRY_DELAY_MS / 1000
+            )
+            pool.start()
+            try:
+                async with queue.iterator() as queue_iter:
+                    async for message in queue_iter:
                         try:
-                            data = json.loads(message.body.decode())
+                            data = parse_purchase(message.body, message.content_type)
                             logger.info(f"Received purchase request: {data}")
-                            
-                            purchase_id = data["purchase_id"]
-                            user_id = data["user_id"]
-                            amount = data["amount"]
-                            
-                            async with database.SessionLocal() as session:
-                                wallet = await session.execute(
-                                    select(models.Wallet).where(models.Wallet.user_id == user_id)
-                                )
-                                wallet = wallet.scalar_one_or_none()
-                                
-                                if not wallet:
-                                    logger.error(f"Wallet not found for user {user_id}")
-                                    continue
-                                    
-                                if wallet.money < amount:
-                                    logger.info(f"Payment for {purchase_id} cancelled due to insufficient funds")
-                                    continue
-                                    
-                                wallet.money -= amount
-                                await session.commit()
-                                
-                                logger.info(f"Payment for {purchase_id} completed. New balance for user {user_id} is {wallet.money}")
-                                
-                                status_message = {
-                                    "purchase_id": purchase_id,
-                                    "status": "FINISHED"
-                                }
-                                
-                                status_queue = await channel.declare_queue(settings.PURCHASE_STATUS_QUEUE, durable=True)
-                                await channel.default_exchange.publish(
-                                    aio_pika.Message(body=json.dumps(status_message).encode()),
-                                    routing_key=status_queue.name
-                                )
-                                
                         except Exception as e:
-                            logger.error(f"Error processing message: {e}")
+                            # It would fail the same way on every redelivery.
+                            logger.error(f"Rejecting malformed purchase message: {e}")
+                            await message.reject()
+                            continue
+                        
+                        await pool.submit(data["user_id"], message, data)
+            finally:
+                await pool.stop()
                             
         except Exception as e:
             logger.error(f"Error in consume: {e}")
             await asyncio.sleep(5)
 
-async def process_outbox(loop):
-    while True:
-        try:
-            connection = await get_rabbitmq_connection(loop)
-            channel = await get_rabbitmq_channel(connection)
-            
-            await asyncio.sleep(5)
-            
-        except Exception as e:
-            logger.error(f"Error in process_outbox: {e}")
-            await asyncio.sleep(5)
+def parse_purchase(body: bytes, content_type: str) -> dict:
+    """Decode and validate a purchase message before it is handed to a worker."""
+    return schemas.PurchaseMessage.model_validate(codec.decode("purchase", body, content_type)).model_dump()
+
+def status_event(purchase_id: int, outcome: wallets.DebitOutcome) -> models.PurchaseStatusOutbox:
+    """Outbox row with the terminal status of a purchase; refusals carry the outcome as reason."""
+    if outcome == wallets.DebitOutcome.DEBITED:
+        return models.PurchaseStatusOutbox(purchase_id=purchase_id, status="FINISHED")
+    return models.PurchaseStatusOutbox(purchase_id=purchase_id, status="CANCELLED", reason=outcome.value)
+
+async def process_payment(data: dict):
+    purchase_id = data["purchase_id"]
+    user_id = data["user_id"]
+    amount = wallets.to_money(data["amount"])
+    
+    async with database.SessionLocal() as session:
+        if not await inbox.record_purchase(session, purchase_id, user_id, amount):
+            logger.info(f"Purchase {purchase_id} already processed, skipping redelivery")
+            return
+
+        outcome, balance = await wallets.debit_wallet(session, user_id, amount, purchase_id)
+        # Committed together with the debit, so the status survives a broker outage.
+        session.add(status_event(purchase_id, outcome))
+        await session.commit()
+    outbox_relay.notify()
+        
+    if outcome == wallets.DebitOutcome.WALLET_NOT_FOUND:
+        logger.error(f"Wallet not found for user {user_id}, purchase {purchase_id} cancelled")
+    elif outcome == wallets.DebitOutcome.INSUFFICIENT_FUNDS:
+        logger.info(f"Payment for {purchase_id} cancelled due to insufficient funds")
+    else:
+        logger.info(f"Payment for {purchase_id} completed. New balance for user {user_id} is {balance}")
+
+async def process_payment_batch(batch: list):
+    """Write-combined payments of one wallet: one transaction and one wallet UPDATE.
+
+    Each purchase is still accepted or refused on its own, in arrival order.
+    """
+    user_id = batch[0]["user_id"]
+    
+    async with database.SessionLocal() as session:
+        new_ids = await inbox.record_purchases(session, batch)
+        purchases = []
+        for data in batch:
+            if data["purchase_id"] in new_ids:
+                new_ids.discard(data["purchase_id"])
+                purchases.append(data)
+            else:
+                logger.info(f"Purchase {data['purchase_id']} already processed, skipping redelivery")
+        if not purchases:
+            return
+        
+        outcomes, balance = await wallets.debit_wallet_batch(
+            session, user_id, [(wallets.to_money(data["amount"]), data["purchase_id"]) for data in purchases]
+        )
+        session.add_all([
+            status_event(data["purchase_id"], outcome) for data, outcome in zip(purchases, outcomes)
+        ])
+        await session.commit()
+    outbox_relay.notify()
+        
+    for data, outcome in zip(purchases, outcomes):
+        if outcome == wallets.DebitOutcome.WALLET_NOT_FOUND:
+            logger.error(f"Wallet not found for user {user_id}, purchase {data['purchase_id']} cancelled")
+        elif outcome == wallets.DebitOutcome.INSUFFICIENT_FUNDS:
+            logger.info(f"Payment for {data['purchase_id']} cancelled due to insufficient funds")
+        else:
+            logger.info(f"Payment for {data['purchase_id']} completed")
+    
+    if wallets.DebitOutcome.DEBITED in outcomes:
+        logger.info(f"New balance for user {user_id} is {balance}")
 
 @app.post("/wallets", response_model=schemas.Wallet)
 async def create_wallet(wallet: schemas.WalletCreate):
     async with database.SessionLocal() as session:
         db_wallet = models.Wallet(user_id=wallet.user_id)
         session.add(db_wallet)
-        await session.commit()
+        try:
+            await session.commit()
+        except IntegrityError:
+            raise HTTPException(status_code=400, detail="Wallet already exists")
         await session.refresh(db_wallet)
         return db_wallet
 
+def validate_chunk(chunk: list, adapter: TypeAdapter) -> tuple:
+    """Split a chunk of (index, item) into validated (index, item) pairs and rejections.
+
+    The chunk is validated in one call; items are only validated one by one to
+    report errors when that fails.
+    """
+    try:
+        return list(zip((index for index, _ in chunk), adapter.validate_python([item for _, item in chunk]))), []
+    except ValidationError:
+        pass
+
+    valid = []
+    rejected = []
+    for index, item in chunk:
+        try:
+            valid.extend((index, value) for value in adapter.validate_python([item]))
+        except ValidationError as e:
+            rejected.append({
+                "index": index, "status": "rejected", "errors": e.errors(include_url=False, include_context=False)
+            })
+    return valid, rejected
+
+@app.post("/wallets/batch", response_model=schemas.WalletBatchResult)
+async def create_wallets_batch(request: Request):
+    """Create many wallets from {"wallets": [{"user_id": ...}, ...]} or an NDJSON stream.
+
+    Users that already have a wallet are reported as "exists" and left untouched.
+    """
+    results = []
+    async with database.SessionLocal() as session:
+        async for chunk in bulk.chunks(bulk.read_items(request, "wallets"), settings.WALLET_BATCH_CHUNK_SIZE):
+            valid, rejected = validate_chunk(chunk, WALLET_BATCH_ITEMS)
+            results.extend(rejected)
+            if not valid:
+                continue
+            
+            created = await wallets.create_wallets(session, [wallet.user_id for _, wallet in valid])
+            for index, wallet in valid:
+                status = "created" if wallet.user_id in created else "exists"
+                created.discard(wallet.user_id)
+                results.append({"index": index, "user_id": wallet.user_id, "status": status})
+        
+        await session.commit()
+    
+    results.sort(key=lambda result: result["index"])
+    statuses = [result["status"] for result in results]
+    logger.info(f"Created {statuses.count('created')} wallets in batch")
+    # Returned as is: re-validating tens of thousands of results against response_model
+    # would cost more than the inserts.
+    return JSONResponse({
+        "created": statuses.count("created"),
+        "existing": statuses.count("exists"),
+        "rejected": statuses.count("rejected"),
+        "results": results
+    })
+
+@app.post("/wallets/deposits/batch", response_model=schemas.DepositBatchResult)
+async def deposit_batch(request: Request):
+    """Credit many wallets from {"deposits": [{"user_id": ..., "amount": ...}, ...]} or NDJSON.
+
+    The whole batch is applied in one transaction: either every valid deposit is
+    credited or none is, so a failed request can be retried as is.
+    """
+    results = []
+    async with database.SessionLocal() as session:
+        async for chunk in bulk.chunks(bulk.read_items(request, "deposits"), settings.WALLET_BATCH_CHUNK_SIZE):
+            valid, rejected = validate_chunk(chunk, DEPOSIT_BATCH_ITEMS)
+            results.extend(rejected)
+            if not valid:
+                continue
+            
+            credited = await wallets.credit_wallets(
+                session, [(deposit.user_id, wallets.to_money(deposit.amount)) for _, deposit in valid]
+            )
+            for index, deposit in valid:
+                status = "credited" if deposit.user_id in credited else "not_found"
+                results.append({"index": index, "user_id": deposit.user_id, "status": status})
+        
+        await session.commit()
+    
+    results.sort(key=lambda result: result["index"])
+    statuses = [result["status"] for result in results]
+    logger.info(f"Credited {statuses.count('credited')} deposits in batch")
+    return JSONResponse({
+        "credited": statuses.count("credited"),
+        "not_found": statuses.count("not_found"),
+        "rejected": statuses.count("rejected"),
+        "results": results
+    })
+
 @app.get("/wallets/{user_id}", response_model=schemas.Wallet)
 async def get_wallet(user_id: int):
     async with database.SessionLocal() as session:
@@ -131,14 +322,46 @@ async def get_wallet(user_id: int):
 @app.post("/wallets/{user_id}/deposit", response_model=schemas.Wallet)
 async def deposit(user_id: int, deposit: schemas.Deposit):
     async with database.SessionLocal() as session:
-        wallet = await session.execute(
-            select(models.Wallet).where(models.Wallet.user_id == user_id)
-        )
-        wallet = wallet.scalar_one_or_none()
+        wallet = await wallets.credit_wallet(session, user_id, wallets.to_money(deposit.amount))
         if not wallet:
             raise HTTPException(status_code=404, detail="Wallet not found")
             
-        wallet.money += deposit.amount
         await session.commit()
-        await session.refresh(wallet)
-        return wallet 
\ No newline at end of file
+        return wallet
+
+@app.get("/wallets/{user_id}/transactions", response_model=schemas.TransactionPage)
+async def get_transactions(
+    user_id: int,
+    limit: int = Query(settings.TRANSACTIONS_PAGE_SIZE, ge=1, le=settings.TRANSACTIONS_MAX_PAGE_SIZE),
+    cursor: Optional[int] = None
+):
+    async with database.SessionLocal() as session:
+        return await ledger.history(session, user_id, limit, cursor)
+
+@app.post("/wallets/{user_id}/rebuild", response_model=schemas.Wallet)
+async def rebuild_wallet(user_id: int):
+    async with database.SessionLocal() as session:
+        wallet = await ledger.rebuild_wallet(session, user_id)
+        if not wallet:
+            raise HTTPException(status_code=404, detail="Wallet not found")
+            
+        await session.commit()
+        return wallet
+
+@app.post("/reconciliation")
+async def run_reconciliation(
+    reemit: bool = False,
+    settle_seconds: float = Query(300.0, ge=0),
+    chunk_size: int = Query(10000, ge=1, le=100000)
+):
+    """Stream orders-vs-payments mismatches as NDJSON, ending with a summary line.
+
+    With reemit=true, lost FINISHED and CANCELLED statuses are queued again in the status outbox.
+    """
+    async def lines():
+        async for line in reconciliation.reconcile(chunk_size, settle_seconds, reemit):
+            yield json.dumps(line) + "\n"
+        if reemit:
+            outbox_relay.notify()
+
+    return StreamingResponse(lines(), media_type=bulk.NDJSON)
@@ -0,0 +1,96 @@
+"""Baseline schema, as previously created by Base.metadata.create_all
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-18 09:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001_baseline"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "wallets",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("money", sa.Float(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("user_id"),
+    )
+    op.create_table(
+        "payment_event_inbox",
+        sa.Column("purchase_id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("amount", sa.Integer(), nullable=False),
+        sa.Column("received_at", sa.DateTime(), nullable=True),
+        sa.Column(
+            "processing_status",
+            sa.Enum("PENDING", "PROCESSED", "FAILED", name="eventprocessingstatus"),
+            nullable=True,
+        ),
+        sa.PrimaryKeyConstraint("purchase_id"),
+    )
+    op.create_index("ix_payment_event_inbox_purchase_id", "payment_event_inbox", ["purchase_id"])
+    op.create_index("ix_payment_event_inbox_user_id", "payment_event_inbox", ["user_id"])
+    op.create_table(
+        "payment_notification_outbox",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("purchase_id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("payment_status", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("is_sent", sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_payment_notification_outbox_id", "payment_notification_outbox", ["id"])
+    op.create_index("ix_payment_notification_outbox_payment_status", "payment_notification_outbox", ["payment_status"])
+    op.create_index("ix_payment_notification_outbox_purchase_id", "payment_notification_outbox", ["purchase_id"])
+    op.create_index("ix_payment_notification_outbox_user_id", "payment_notification_outbox", ["user_id"])
+    op.create_table(
+        "purchase_processing_inbox",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("purchase_id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("amount", sa.Float(), nullable=False),
+        sa.Column("is_processed", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("purchase_id"),
+    )
+    op.create_table(
+        "purchase_status_outbox",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("purchase_id", sa.Integer(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("is_sent", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("purchase_status_outbox")
+    op.drop_table("purchase_processing_inbox")
+    op.drop_index("ix_payment_notification_outbox_user_id", table_name="payment_notification_outbox")
+    op.drop_index("ix_payment_notification_outbox_purchase_id", table_name="payment_notification_outbox")
+    op.drop_index("ix_payment_notification_outbox_payment_status", table_name="payment_notification_outbox")
+    op.drop_index("ix_payment_notification_outbox_id", table_name="payment_notification_outbox")
+    op.drop_table("payment_notification_outbox")
+    op.drop_index("ix_payment_event_inbox_user_id", table_name="payment_event_inbox")
+    op.drop_index("ix_payment_event_inbox_purchase_id", table_name="payment_event_inbox")
+    op.drop_table("payment_event_inbox")
+    op.drop_table("wallets")
+    sa.Enum(name="eventprocessingstatus").drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,34 @@
+"""Partial index on unsent purchase status outbox rows
+
+Revision ID: 0002_status_outbox_unsent
+Revises: 0001_baseline
+Create Date: 2026-10-18 12:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002_status_outbox_unsent"
+down_revision: Union[str, Sequence[str], None] = "0001_baseline"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        "ix_purchase_status_outbox_unsent",
+        "purchase_status_outbox",
+        ["id"],
+        postgresql_where=sa.text("NOT is_sent"),
+        sqlite_where=sa.text("NOT is_sent"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_purchase_status_outbox_unsent", table_name="purchase_status_outbox")
@@ -0,0 +1,51 @@
+"""Consolidate the payment inboxes into purchase_processing_inbox
+
+Revision ID: 0003_consolidate_inbox
+Revises: 0002_status_outbox_unsent
+Create Date: 2026-10-18 13:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003_consolidate_inbox"
+down_revision: Union[str, Sequence[str], None] = "0002_status_outbox_unsent"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.drop_index("ix_payment_event_inbox_user_id", table_name="payment_event_inbox")
+    op.drop_index("ix_payment_event_inbox_purchase_id", table_name="payment_event_inbox")
+    op.drop_table("payment_event_inbox")
+    sa.Enum(name="eventprocessingstatus").drop(op.get_bind(), checkfirst=True)
+    with op.batch_alter_table("purchase_processing_inbox") as batch_op:
+        batch_op.drop_column("is_processed")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("purchase_processing_inbox") as batch_op:
+        batch_op.add_column(
+            sa.Column("is_processed", sa.Boolean(), server_default=sa.true(), nullable=False)
+        )
+    op.create_table(
+        "payment_event_inbox",
+        sa.Column("purchase_id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("amount", sa.Integer(), nullable=False),
+        sa.Column("received_at", sa.DateTime(), nullable=True),
+        sa.Column(
+            "processing_status",
+            sa.Enum("PENDING", "PROCESSED", "FAILED", name="eventprocessingstatus"),
+            nullable=True,
+        ),
+        sa.PrimaryKeyConstraint("purchase_id"),
+    )
+    op.create_index("ix_payment_event_inbox_purchase_id", "payment_event_inbox", ["purchase_id"])
+    op.create_index("ix_payment_event_inbox_user_id", "payment_event_inbox", ["user_id"])
@@ -0,0 +1,70 @@
+"""Append-only wallet ledger with balance snapshots
+
+Revision ID: 0004_wallet_ledger
+Revises: 0003_consolidate_inbox
+Create Date: 2026-10-18 14:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004_wallet_ledger"
+down_revision: Union[str, Sequence[str], None] = "0003_consolidate_inbox"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("wallets") as batch_op:
+        batch_op.alter_column(
+            "money", existing_type=sa.Float(), type_=sa.Numeric(18, 2), existing_nullable=False
+        )
+    op.create_table(
+        "wallet_transactions",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("type", sa.Enum("DEPOSIT", "DEBIT", name="transactiontype"), nullable=False),
+        sa.Column("amount", sa.Numeric(18, 2), nullable=False),
+        sa.Column("purchase_id", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_wallet_transactions_user_id_id", "wallet_transactions", ["user_id", "id"])
+    op.create_table(
+        "wallet_snapshots",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("balance", sa.Numeric(18, 2), nullable=False),
+        sa.Column("last_transaction_id", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_wallet_snapshots_user_id_last_transaction_id",
+        "wallet_snapshots",
+        ["user_id", "last_transaction_id"],
+        unique=True,
+    )
+    # Balances from before the ledger become opening snapshots, so rebuilds start from them.
+    op.execute(
+        "INSERT INTO wallet_snapshots (user_id, balance, last_transaction_id) "
+        "SELECT user_id, money, 0 FROM wallets"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_wallet_snapshots_user_id_last_transaction_id", table_name="wallet_snapshots")
+    op.drop_table("wallet_snapshots")
+    op.drop_index("ix_wallet_transactions_user_id_id", table_name="wallet_transactions")
+    op.drop_table("wallet_transactions")
+    sa.Enum(name="transactiontype").drop(op.get_bind(), checkfirst=True)
+    with op.batch_alter_table("wallets") as batch_op:
+        batch_op.alter_column(
+            "money", existing_type=sa.Numeric(18, 2), type_=sa.Float(), existing_nullable=False
+        )
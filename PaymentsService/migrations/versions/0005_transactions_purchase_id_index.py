@@ -0,0 +1,34 @@
+"""Index debits by purchase_id for reconciliation
+
+Revision ID: 0005_transactions_purchase_id
+Revises: 0004_wallet_ledger
+Create Date: 2026-10-18 15:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005_transactions_purchase_id"
+down_revision: Union[str, Sequence[str], None] = "0004_wallet_ledger"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        "ix_wallet_transactions_purchase_id",
+        "wallet_transactions",
+        ["purchase_id"],
+        postgresql_where=sa.text("purchase_id IS NOT NULL"),
+        sqlite_where=sa.text("purchase_id IS NOT NULL"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_wallet_transactions_purchase_id", table_name="wallet_transactions")
@@ -0,0 +1,28 @@
+"""Reason code on purchase status outbox rows
+
+Revision ID: 0006_status_outbox_reason
+Revises: 0005_transactions_purchase_id
+Create Date: 2026-10-18 16:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006_status_outbox_reason"
+down_revision: Union[str, Sequence[str], None] = "0005_transactions_purchase_id"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("purchase_status_outbox", sa.Column("reason", sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("purchase_status_outbox", "reason")
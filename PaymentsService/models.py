@@ -8,7 +8,10 @@ from sqlalchemy import (
     Enum as SqlEnum,
     Boolean,
     Float,
+    Index,
+    Numeric,
     func,
+    text,
 )
 from sqlalchemy.orm import declarative_base
 
@@ -19,26 +22,44 @@ class Wallet(Base):
     __tablename__ = "wallets"
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, nullable=False, unique=True)
-    money = Column(Float, nullable=False, default=0)
+    # Cached balance; the ledger (Transaction plus WalletSnapshot) is the source of truth.
+    money = Column(Numeric(18, 2), nullable=False, default=0)
     created_at = Column(DateTime, server_default=func.now())
 
 
-class EventProcessingStatus(str, Enum):
-    PENDING = "PENDING"
-    PROCESSED = "PROCESSED"
-    FAILED = "FAILED"
+class TransactionType(str, Enum):
+    DEPOSIT = "DEPOSIT"
+    DEBIT = "DEBIT"
 
 
-class PaymentEventInbox(Base):
-    """Transactional Inbox for incoming payment events."""
-    __tablename__ = "payment_event_inbox"
-    purchase_id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, index=True, nullable=False)
-    amount = Column(Integer, nullable=False)
-    received_at = Column(DateTime, default=datetime.utcnow)
-    processing_status = Column(
-        SqlEnum(EventProcessingStatus), default=EventProcessingStatus.PENDING
+class Transaction(Base):
+    """Append-only wallet ledger; rows are never updated or deleted."""
+    __tablename__ = "wallet_transactions"
+    __table_args__ = (
+        Index("ix_wallet_transactions_user_id_id", "user_id", "id"),
+        # Debits in purchase_id order, for the reconciliation merge-join.
+        Index("ix_wallet_transactions_purchase_id", "purchase_id", postgresql_where=text("purchase_id IS NOT NULL"), sqlite_where=text("purchase_id IS NOT NULL")),
     )
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    type = Column(SqlEnum(TransactionType), nullable=False)
+    # Always positive; type gives the sign.
+    amount = Column(Numeric(18, 2), nullable=False)
+    purchase_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+
+
+class WalletSnapshot(Base):
+    """Balance of a wallet including every ledger entry up to last_transaction_id."""
+    __tablename__ = "wallet_snapshots"
+    __table_args__ = (
+        Index("ix_wallet_snapshots_user_id_last_transaction_id", "user_id", "last_transaction_id", unique=True),
+    )
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    balance = Column(Numeric(18, 2), nullable=False)
+    last_transaction_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
 
 
 class PaymentNotificationOutbox(Base):
@@ -53,19 +74,24 @@ class PaymentNotificationOutbox(Base):
 
 
 class PurchaseInbox(Base):
+    """Transactional Inbox: one row per purchase_id, written in the same transaction as the debit."""
     __tablename__ = "purchase_processing_inbox"
     id = Column(Integer, primary_key=True)
     purchase_id = Column(Integer, nullable=False, unique=True)
     user_id = Column(Integer, nullable=False)
     amount = Column(Float, nullable=False)
-    is_processed = Column(Boolean, default=False, nullable=False)
     created_at = Column(DateTime, server_default=func.now())
 
 
 class PurchaseStatusOutbox(Base):
     __tablename__ = "purchase_status_outbox"
+    __table_args__ = (
+        Index("ix_purchase_status_outbox_unsent", "id", postgresql_where=text("NOT is_sent"), sqlite_where=text("NOT is_sent")),
+    )
     id = Column(Integer, primary_key=True)
     purchase_id = Column(Integer, nullable=False)
     status = Column(String, nullable=False)
+    # Why the payment was refused (a DebitOutcome value); None for FINISHED.
+    reason = Column(String, nullable=True)
     is_sent = Column(Boolean, default=False, nullable=False)
     created_at = Column(DateTime, server_default=func.now()) 
\ No newline at end of file
@@ -0,0 +1,70 @@
+import statistics
+import time
+from collections import deque
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+class PoolMetrics:
+    """Checkout wait times and in-use connection counts of the engine pool."""
+
+    def __init__(self, window: int = 1000):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.in_use_peak = 0
+        self._recent_waits = deque(maxlen=window)
+
+    def observe_wait(self, seconds: float, timed_out: bool = False):
+        if timed_out:
+            self.timeouts += 1
+        else:
+            self.checkouts += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+        self._recent_waits.append(seconds)
+
+    def observe_in_use(self, in_use: int):
+        self.in_use_peak = max(self.in_use_peak, in_use)
+
+    def stats(self, pool) -> dict:
+        waits = sorted(self._recent_waits)
+        attempts = self.checkouts + self.timeouts
+        stats = {
+            "pool": type(pool).__name__,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "in_use_peak": self.in_use_peak,
+            "wait_ms_avg": self.wait_total / attempts * 1000 if attempts else 0.0,
+            "wait_ms_p50": statistics.median(waits) * 1000 if waits else 0.0,
+            "wait_ms_p99": waits[int(len(waits) * 0.99)] * 1000 if waits else 0.0,
+            "wait_ms_max": self.wait_max * 1000,
+        }
+        # The SQLite pools used in tests do not track sizes.
+        if isinstance(pool, QueuePool):
+            stats.update({
+                "size": pool.size(),
+                "in_use": pool.checkedout(),
+                "idle": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+            })
+        return stats
+
+
+metrics = PoolMetrics()
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            metrics.observe_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        metrics.observe_wait(time.perf_counter() - started)
+        metrics.observe_in_use(self.checkedout())
+        return connection
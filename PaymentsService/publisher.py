@@ -0,0 +1,66 @@
+import logging
+
+import aio_pika
+import backoff
+from aio_pika.pool import Pool
+
+logger = logging.getLogger(__name__)
+
+
+class RabbitMQPublisher:
+    """App-lifetime publisher: one robust connection and a bounded pool of confirm channels."""
+
+    def __init__(self, url: str, pool_size: int = 8, queues: tuple = (), fanout_exchanges: tuple = ()):
+        self.url = url
+        self.pool_size = pool_size
+        self.queues = queues
+        self.fanout_exchanges = fanout_exchanges
+        self.connection = None
+        self.channel_pool = None
+
+    @backoff.on_exception(backoff.expo, Exception, max_time=300)
+    async def _connect(self):
+        return await aio_pika.connect_robust(self.url)
+
+    async def start(self):
+        self.connection = await self._connect()
+        self.channel_pool = Pool(self._open_channel, max_size=self.pool_size)
+
+        async with self.channel_pool.acquire() as channel:
+            for name in self.queues:
+                await channel.declare_queue(name, durable=True)
+            for name in self.fanout_exchanges:
+                await channel.declare_exchange(name, aio_pika.ExchangeType.FANOUT, durable=True)
+
+        logger.info(
+            f"Publisher connected, channel pool size {self.pool_size}, "
+            f"declared {list(self.queues) + list(self.fanout_exchanges)}"
+        )
+
+    async def _open_channel(self):
+        return await self.connection.channel(publisher_confirms=True)
+
+    async def publish(self, body: bytes, routing_key: str, content_type: str = None, exchange: str = None):
+        """Publish to routing_key on the default exchange, or to a declared exchange by name."""
+        if self.channel_pool is None:
+            raise RuntimeError("Publisher is not started")
+
+        async with self.channel_pool.acquire() as channel:
+            target = channel.default_exchange if exchange is None else await channel.get_exchange(exchange, ensure=False)
+            await target.publish(
+                aio_pika.Message(
+                    body=body,
+                    content_type=content_type,
+                    delivery_mode=aio_pika.DeliveryMode.PERSISTENT
+                ),
+                routing_key=routing_key
+            )
+
+    async def close(self):
+        if self.channel_pool is not None:
+            await self.channel_pool.close()
+            self.channel_pool = None
+        if self.connection is not None:
+            await self.connection.close()
+            self.connection = None
+        logger.info("Publisher closed")
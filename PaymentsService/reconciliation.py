@@ -0,0 +1,226 @@
+"""Orders-vs-payments reconciliation.
+
+Walks OrdersService's purchases, the DEBIT entries of the wallet ledger and the
+payment inbox in purchase_id order over server-side cursors and merge-joins them, so
+memory use does not depend on table size. Mismatches are yielded one by one:
+
+- missing_debit: the purchase is FINISHED but no wallet was debited for it. Purchases
+  paid before the ledger existed (migration 0004) have no DEBIT entry; they are only
+  counted as pre_ledger in the summary.
+- missing_status: a debit exists but the purchase is still NEW (lost status message)
+- missing_cancelled_status: the payment was refused but the purchase is still NEW
+  (lost CANCELLED status message)
+- unprocessed: the purchase is still NEW and PaymentsService never received it
+- debit_on_cancelled: a debit exists for a CANCELLED purchase
+- orphan_debit: a debit for a purchase that does not exist
+- duplicate_debit: more than one debit for the same purchase
+
+With reemit, the lost status of every missing_status and missing_cancelled_status
+purchase is queued again in PurchaseStatusOutbox: FINISHED, or CANCELLED with the
+reason recorded when the payment was refused. The outbox relay publishes it.
+
+Usage: python reconciliation.py [--reemit] > mismatches.ndjson
+"""
+import argparse
+import asyncio
+import json
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, insert, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import models
+import database
+from config import settings
+
+# Read-only view of the OrdersService table; that service owns and migrates it.
+orders_metadata = MetaData()
+purchases = Table(
+    "purchases",
+    orders_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("status", String),
+    Column("created_at", DateTime),
+)
+
+FINISHED = "FINISHED"
+CANCELLED = "CANCELLED"
+NEW = "NEW"
+REEMITTED_STATUS = {"missing_status": FINISHED, "missing_cancelled_status": CANCELLED}
+
+
+def orders_engine():
+    if settings.ORDERS_DB_URL in (None, "", settings.DB_URL):
+        return database.engine
+    return create_async_engine(settings.ORDERS_DB_URL)
+
+
+async def stream(engine, query, chunk_size: int):
+    async with engine.connect() as connection:
+        result = await connection.stream(query.execution_options(yield_per=chunk_size))
+        async for row in result:
+            yield row
+
+
+async def next_row(rows):
+    return await anext(rows, None)
+
+
+async def ledger_started_at(session):
+    """When migration 0004 opened the ledger; None if no wallet existed then.
+
+    That migration gave every existing wallet an opening snapshot with
+    last_transaction_id 0, which no later snapshot has.
+    """
+    return await session.scalar(
+        select(func.min(models.WalletSnapshot.created_at)).where(models.WalletSnapshot.last_transaction_id == 0)
+    )
+
+
+async def refusal_reasons(session, purchase_ids: list) -> dict:
+    """Reason of each refused payment, from the CANCELLED status written with its inbox row."""
+    result = await session.execute(
+        select(models.PurchaseStatusOutbox.purchase_id, models.PurchaseStatusOutbox.reason)
+        .where(
+            models.PurchaseStatusOutbox.purchase_id.in_(purchase_ids),
+            models.PurchaseStatusOutbox.status == CANCELLED,
+        )
+    )
+    return dict(result.all())
+
+
+async def reconcile(chunk_size: int = 10000, settle_seconds: float = 300.0, reemit: bool = False):
+    """Yield mismatch dicts, then a final {"summary": ...} dict.
+
+    Purchases younger than settle_seconds, and everything after them, are left out so
+    that payments still in flight are not reported.
+    """
+    engine = orders_engine()
+    cutoff = datetime.utcnow() - timedelta(seconds=settle_seconds)
+    async with engine.connect() as connection:
+        upto = await connection.scalar(
+            select(func.max(purchases.c.id)).where(purchases.c.created_at < cutoff)
+        )
+    upto = upto or 0
+    async with database.SessionLocal() as session:
+        ledger_start = await ledger_started_at(session)
+
+    orders = stream(
+        engine,
+        select(purchases.c.id, purchases.c.status)
+        .where(purchases.c.id <= upto)
+        .order_by(purchases.c.id),
+        chunk_size,
+    )
+    debits = stream(
+        database.engine,
+        select(models.Transaction.purchase_id)
+        .where(models.Transaction.purchase_id.is_not(None), models.Transaction.purchase_id <= upto)
+        .order_by(models.Transaction.purchase_id),
+        chunk_size,
+    )
+
+    processed = stream(
+        database.engine,
+        select(models.PurchaseInbox.purchase_id, models.PurchaseInbox.created_at)
+        .where(models.PurchaseInbox.purchase_id <= upto)
+        .order_by(models.PurchaseInbox.purchase_id),
+        chunk_size,
+    )
+    inbox_row = await next_row(processed)
+
+    async def inbox_entry(purchase_id):
+        # Called with increasing purchase_ids, so the inbox cursor only moves forward.
+        nonlocal inbox_row
+        while inbox_row is not None and inbox_row.purchase_id < purchase_id:
+            inbox_row = await next_row(processed)
+        return inbox_row if inbox_row is not None and inbox_row.purchase_id == purchase_id else None
+
+    async def paid_before_ledger(purchase_id):
+        if ledger_start is None:
+            return False
+        entry = await inbox_entry(purchase_id)
+        return entry is not None and entry.created_at < ledger_start
+
+    counts = Counter()
+    pending_reemit = []
+
+    async def mismatch(purchase_id, kind, status):
+        counts[kind] += 1
+        reemitted = reemit and kind in REEMITTED_STATUS
+        if reemitted:
+            pending_reemit.append((purchase_id, REEMITTED_STATUS[kind]))
+            if len(pending_reemit) >= chunk_size:
+                await flush_reemit()
+        return {"purchase_id": purchase_id, "kind": kind, "order_status": status, "reemitted": reemitted}
+
+    async def flush_reemit():
+        if not pending_reemit:
+            return
+        async with database.SessionLocal() as session:
+            reasons = await refusal_reasons(
+                session, [purchase_id for purchase_id, status in pending_reemit if status == CANCELLED]
+            )
+            await session.execute(
+                insert(models.PurchaseStatusOutbox),
+                [
+                    {"purchase_id": purchase_id, "status": status, "reason": reasons.get(purchase_id)}
+                    for purchase_id, status in pending_reemit
+                ]
+            )
+            await session.commit()
+        counts["reemitted"] += len(pending_reemit)
+        pending_reemit.clear()
+
+    order = await next_row(orders)
+    debit = await next_row(debits)
+    while order is not None or debit is not None:
+        if debit is None or (order is not None and order.id < debit.purchase_id):
+            counts["orders"] += 1
+            if order.status == FINISHED:
+                if await paid_before_ledger(order.id):
+                    counts["pre_ledger"] += 1
+                else:
+                    yield await mismatch(order.id, "missing_debit", order.status)
+            elif order.status == NEW:
+                kind = "missing_cancelled_status" if await inbox_entry(order.id) else "unprocessed"
+                yield await mismatch(order.id, kind, order.status)
+            order = await next_row(orders)
+        elif order is None or debit.purchase_id < order.id:
+            counts["debits"] += 1
+            yield await mismatch(debit.purchase_id, "orphan_debit", None)
+            debit = await next_row(debits)
+        else:
+            counts["orders"] += 1
+            counts["debits"] += 1
+            if order.status == NEW:
+                yield await mismatch(order.id, "missing_status", order.status)
+            elif order.status != FINISHED:
+                yield await mismatch(order.id, "debit_on_cancelled", order.status)
+
+            purchase_id = debit.purchase_id
+            debit = await next_row(debits)
+            while debit is not None and debit.purchase_id == purchase_id:
+                counts["debits"] += 1
+                yield await mismatch(purchase_id, "duplicate_debit", order.status)
+                debit = await next_row(debits)
+            order = await next_row(orders)
+
+    await flush_reemit()
+    yield {"summary": {"checked_up_to_purchase_id": upto, **counts}}
+
+
+async def main(args):
+    async for line in reconcile(args.chunk_size, args.settle_seconds, args.reemit):
+        sys.stdout.write(json.dumps(line) + "\n")
+    await database.engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--settle-seconds", type=float, default=300.0)
+    parser.add_argument("--reemit", action="store_true")
+    asyncio.run(main(parser.parse_args()))
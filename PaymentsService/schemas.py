@@ -1,5 +1,9 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
+from decimal import Decimal
+from typing import Any, List, Optional
+
+from models import TransactionType
 
 
 class WalletBase(BaseModel):
@@ -11,7 +15,20 @@ class WalletCreate(WalletBase):
 
 
 class Deposit(BaseModel):
-    amount: float
+    # Ledger amounts are always positive; a negative deposit would be a hidden debit.
+    # More than two decimal places would be rounded, possibly down to 0.00.
+    amount: Decimal = Field(gt=0, decimal_places=2)
+
+
+class WalletDeposit(Deposit):
+    user_id: int
+
+
+class PurchaseMessage(BaseModel):
+    """A purchase_queue message from OrdersService."""
+    purchase_id: int
+    user_id: int
+    amount: Decimal = Field(gt=0, decimal_places=2)
 
 
 class Wallet(WalletBase):
@@ -21,3 +38,41 @@ class Wallet(WalletBase):
 
     class Config:
         from_attributes = True
+
+
+class Transaction(BaseModel):
+    id: int
+    user_id: int
+    type: TransactionType
+    amount: float
+    purchase_id: Optional[int] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class TransactionPage(BaseModel):
+    transactions: List[Transaction]
+    next_cursor: Optional[int] = None
+
+
+class BulkItemResult(BaseModel):
+    index: int
+    user_id: Optional[int] = None
+    status: str
+    errors: Optional[List[Any]] = None
+
+
+class WalletBatchResult(BaseModel):
+    created: int
+    existing: int
+    rejected: int
+    results: List[BulkItemResult]
+
+
+class DepositBatchResult(BaseModel):
+    credited: int
+    not_found: int
+    rejected: int
+    results: List[BulkItemResult]
@@ -0,0 +1,185 @@
+from decimal import Decimal
+from enum import Enum
+
+from sqlalchemy import Numeric, bindparam, exists, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+import models
+
+CENT = Decimal("0.01")
+
+
+class DebitOutcome(str, Enum):
+    DEBITED = "DEBITED"
+    INSUFFICIENT_FUNDS = "INSUFFICIENT_FUNDS"
+    WALLET_NOT_FOUND = "WALLET_NOT_FOUND"
+
+
+def to_money(value) -> Decimal:
+    """Amounts arrive as JSON/msgpack floats; go through str so 19.99 stays 19.99.
+
+    Fractions of a cent are refused rather than rounded away.
+    """
+    amount = Decimal(str(value))
+    money = amount.quantize(CENT)
+    if money != amount:
+        raise ValueError(f"Amount {value} has fractions of a cent")
+    return money
+
+
+def debit_statement(user_id: int, amount: Decimal):
+    return (
+        update(models.Wallet)
+        .where(models.Wallet.user_id == user_id, models.Wallet.money >= amount)
+        .values(money=models.Wallet.money - amount)
+        .returning(models.Wallet.money)
+    )
+
+
+async def append_entries(session, user_id: int, entry_type: models.TransactionType, entries: list):
+    """Append ledger rows for (amount, purchase_id) pairs with one multi-row INSERT."""
+    await session.execute(
+        insert(models.Transaction),
+        [
+            {"user_id": user_id, "type": entry_type, "amount": amount, "purchase_id": purchase_id}
+            for amount, purchase_id in entries
+        ]
+    )
+
+
+async def debit_wallet(session, user_id: int, amount: Decimal, purchase_id: int = None):
+    """Debit a wallet with one conditional UPDATE; returns (outcome, new balance or None).
+
+    The balance check happens in the UPDATE itself, so parallel debits and deposits on
+    the same wallet can never overdraw it or lose an update. A successful debit is
+    appended to the ledger in the same transaction.
+    """
+    if session.bind.dialect.name == "postgresql":
+        # Data-modifying CTE: the debit and the wallet-exists check are a single statement.
+        debit = debit_statement(user_id, amount).cte("debit")
+        result = await session.execute(
+            select(
+                select(debit.c.money).scalar_subquery(),
+                exists().where(models.Wallet.user_id == user_id),
+            )
+        )
+        balance, wallet_exists = result.one()
+    else:
+        # SQLite has no DML in CTEs; the existence check only runs when the debit did not apply.
+        result = await session.execute(debit_statement(user_id, amount))
+        balance = result.scalar_one_or_none()
+        wallet_exists = balance is not None or await session.scalar(
+            select(exists().where(models.Wallet.user_id == user_id))
+        )
+
+    if balance is not None:
+        await append_entries(session, user_id, models.TransactionType.DEBIT, [(amount, purchase_id)])
+        return DebitOutcome.DEBITED, balance
+    if not wallet_exists:
+        return DebitOutcome.WALLET_NOT_FOUND, None
+    return DebitOutcome.INSUFFICIENT_FUNDS, None
+
+
+async def debit_wallet_batch(session, user_id: int, debits: list):
+    """Write-combined debits of one wallet; returns (outcome per debit, new balance or None).
+
+    debits are (amount, purchase_id) pairs. The wallet row is locked once, every amount
+    is checked in order against the running balance, the accepted total is applied with
+    a single UPDATE and the accepted debits are appended to the ledger in one INSERT.
+    """
+    balance = await session.scalar(
+        select(models.Wallet.money).where(models.Wallet.user_id == user_id).with_for_update()
+    )
+    if balance is None:
+        return [DebitOutcome.WALLET_NOT_FOUND] * len(debits), None
+
+    outcomes = []
+    accepted = []
+    total = Decimal(0)
+    for amount, purchase_id in debits:
+        if balance - total >= amount:
+            total += amount
+            accepted.append((amount, purchase_id))
+            outcomes.append(DebitOutcome.DEBITED)
+        else:
+            outcomes.append(DebitOutcome.INSUFFICIENT_FUNDS)
+
+    if accepted:
+        balance = await session.scalar(
+            update(models.Wallet)
+            .where(models.Wallet.user_id == user_id)
+            .values(money=models.Wallet.money - total)
+            .returning(models.Wallet.money)
+        )
+        await append_entries(session, user_id, models.TransactionType.DEBIT, accepted)
+    return outcomes, balance
+
+
+async def credit_wallet(session, user_id: int, amount: Decimal):
+    """Add to a wallet atomically; returns the updated Wallet or None if there is none."""
+    result = await session.execute(
+        update(models.Wallet)
+        .where(models.Wallet.user_id == user_id)
+        .values(money=models.Wallet.money + amount)
+        .returning(models.Wallet)
+    )
+    wallet = result.scalar_one_or_none()
+    if wallet is not None:
+        await append_entries(session, user_id, models.TransactionType.DEPOSIT, [(amount, None)])
+    return wallet
+
+
+async def create_wallets(session, user_ids: list) -> set:
+    """Create empty wallets, skipping users that already have one.
+
+    Runs as one executemany, which SQLAlchemy sends as batched multi-row
+    INSERT ... ON CONFLICT DO NOTHING RETURNING statements. Returns the user_ids whose
+    wallet was created by this call.
+    """
+    dialect = postgresql if session.bind.dialect.name == "postgresql" else sqlite
+    connection = await session.connection()
+    result = await connection.execute(
+        dialect.insert(models.Wallet.__table__)
+        .on_conflict_do_nothing(index_elements=[models.Wallet.user_id])
+        .returning(models.Wallet.user_id),
+        [{"user_id": user_id, "money": 0} for user_id in user_ids]
+    )
+    return set(result.scalars().all())
+
+
+async def credit_wallets(session, credits: list) -> set:
+    """Apply many (user_id, amount) deposits; returns the user_ids that have a wallet.
+
+    Deposits for users without a wallet are not applied. Amounts are summed per
+    wallet, so each wallet gets one UPDATE in a single executemany, and the ledger
+    entries go in with one batched INSERT.
+    """
+    totals = {}
+    for user_id, amount in credits:
+        totals[user_id] = totals.get(user_id, 0) + amount
+
+    connection = await session.connection()
+    result = await connection.execute(
+        select(models.Wallet.user_id).where(models.Wallet.user_id.in_(bindparam("user_ids", expanding=True))),
+        {"user_ids": list(totals)}
+    )
+    credited = set(result.scalars().all())
+    if not credited:
+        return credited
+
+    wallets = models.Wallet.__table__
+    await connection.execute(
+        update(wallets)
+        .where(wallets.c.user_id == bindparam("credit_user_id"))
+        .values(money=wallets.c.money + bindparam("credit_amount", type_=Numeric(18, 2))),
+        [{"credit_user_id": user_id, "credit_amount": totals[user_id]} for user_id in sorted(credited)]
+    )
+    await connection.execute(
+        insert(models.Transaction.__table__),
+        [
+            {"user_id": user_id, "type": models.TransactionType.DEPOSIT, "amount": amount, "purchase_id": None}
+            for user_id, amount in credits
+            if user_id in credited
+        ]
+    )
+    return credited
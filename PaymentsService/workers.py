@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PaymentWorkerPool:
+    """Runs payment messages on N asyncio workers, routed by hash of user_id.
+
+    All messages for one wallet land on the same worker and are handled in arrival
+    order, while different wallets proceed in parallel. A message is acked only after
+    its handler has returned, i.e. after the worker's transaction has committed.
+
+    A failing handler is retried up to max_attempts times with doubling delays from
+    retry_delay. After that the message is nacked with requeue, or, if the broker had
+    already redelivered it once, rejected without requeue so a message that can never
+    be processed does not circle forever (a dead-letter policy on the queue keeps it).
+
+    With max_batch > 1 a worker gathers up to max_batch queued messages for at most
+    max_wait seconds and passes the messages of each wallet that occurs more than once
+    to batch_handler in one call (write-combining for hot wallets). When that call
+    fails the messages are handled one by one, so a bad message fails only itself.
+    """
+
+    def __init__(
+        self, workers: int, handler, batch_handler=None, max_batch: int = 1, max_wait: float = 0.0,
+        max_attempts: int = 3, retry_delay: float = 0.1
+    ):
+        self.workers = workers
+        self.handler = handler
+        self.batch_handler = batch_handler
+        self.max_batch = max_batch if batch_handler else 1
+        self.max_wait = max_wait
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._queues = [asyncio.Queue() for _ in range(workers)]
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [
+            asyncio.create_task(self._work(queue)) for queue in self._queues
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, user_id: int, message, data: dict):
+        await self._queues[hash(user_id) % self.workers].put((user_id, message, data))
+
+    async def _work(self, queue: asyncio.Queue):
+        while True:
+            by_wallet = {}
+            for user_id, message, data in await self._collect(queue):
+                by_wallet.setdefault(user_id, []).append((message, data))
+
+            for items in by_wallet.values():
+                await self._handle(items)
+
+    async def _collect(self, queue: asyncio.Queue) -> list:
+        batch = [await queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _handle(self, items: list):
+        if len(items) > 1:
+            try:
+                await self.batch_handler([data for _, data in items])
+            except Exception as e:
+                # Nothing was committed; retry in arrival order, one message at a time.
+                logger.error(f"Error processing batch of {len(items)} messages, handling them one by one: {e}")
+            else:
+                for message, _ in items:
+                    await self._settle(message.ack)
+                return
+
+        for message, data in items:
+            await self._handle_one(message, data)
+
+    async def _handle_one(self, message, data: dict):
+        delay = self.retry_delay
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await self.handler(data)
+            except Exception as e:
+                error = e
+                if attempt < self.max_attempts:
+                    await asyncio.sleep(delay)
+                    delay *= 2
+            else:
+                await self._settle(message.ack)
+                return
+
+        if message.redelivered:
+            logger.error(f"Giving up on message after {self.max_attempts} attempts on redelivery, rejecting: {error}")
+            await self._settle(message.reject, requeue=False)
+        else:
+            # The broker redelivers and the inbox drops any duplicate.
+            logger.error(f"Error processing message after {self.max_attempts} attempts, requeueing: {error}")
+            await self._settle(message.nack, requeue=True)
+
+    async def _settle(self, settle, **kwargs):
+        try:
+            await settle(**kwargs)
+        except Exception as e:
+            logger.error(f"Error settling message: {e}")